@@ -37,5 +37,4 @@
     ],
     'installable': True,
     'auto_install': False,
-    'post_load': 'patch_fields',
 }
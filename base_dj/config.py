@@ -48,6 +48,14 @@ ADDONS_BLACKLIST = (
 ADDONS_NAME_DOMAIN = '("name", "not in", (%s))' % \
     ','.join(["'%s'" % x for x in ADDONS_BLACKLIST])
 
+# Songs w/ more records than this are switched to `load_csv_heavy`.
+# Override it w/ `base_dj.heavy_import_threshold` system parameter
+# (0 disables the switch).
+HEAVY_IMPORT_THRESHOLD = 1000
+# Max amount of records per csv file for `load_csv_heavy` songs.
+# Override it w/ `base_dj.heavy_import_chunk_size` system parameter.
+HEAVY_IMPORT_CHUNK_SIZE = 5000
+
 # TODO: move this to independent records
 # then we can filter particular song types by genre
 SONG_TYPES = {
@@ -70,10 +78,28 @@ SONG_TYPES = {
             'template_path': 'base_dj:discs/song.tmpl',
         },
     },
-    # TODO
-    # switch automatically to `load_csv_heavy
-    # when this amount of records is reached
-    # HEAVY_IMPORT_THRESHOLD = 1000
+    # `load_csv` songs switch automatically to this type
+    # when they have more records than `HEAVY_IMPORT_THRESHOLD`.
+    'load_csv_heavy': {
+        'name': _('Load CSV heavy (chunked, deferred computations)'),
+        'prefix': 'load_',
+        'sequence': 15,
+        'defaults': {
+            'only_config': False,
+            'template_path': 'base_dj:discs/song_heavy.tmpl',
+        }
+    },
+    # plain tables only: rows are loaded via SQL COPY,
+    # see `base_dj.copy_loader.copy_unsafe_reasons`.
+    'load_csv_copy': {
+        'name': _('Load CSV via COPY (plain tables only)'),
+        'prefix': 'load_',
+        'sequence': 16,
+        'defaults': {
+            'only_config': False,
+            'template_path': 'base_dj:discs/song_copy.tmpl',
+        }
+    },
     'load_csv_defer_parent': {
         'name': _('Load CSV defer parent computation'),
         'prefix': 'load_',
@@ -5,6 +5,7 @@ from odoo import http
 from odoo.http import request
 import os
 import mimetypes
+import werkzeug.wrappers
 from ..utils import string_to_list
 
 
@@ -12,10 +13,10 @@ class DJ(http.Controller):
     """Controller for dj tools."""
 
     def _make_download_headers(self, data, filename, content_type):
-        return [
+        """Prepare headers. Pass `data=None` for streamed content."""
+        headers = [
             ('Content-Disposition', 'attachment; filename=%s' % filename),
             ('Content-Type', '%s; charset=utf-8' % content_type),
-            ('Content-Length', "%d" % len(data)),
             ('Pragma', "no-cache"),
             ('Cache-Control',
              'must-revalidate, \
@@ -24,6 +25,9 @@ class DJ(http.Controller):
                 public'),
             ('Expires', "0"),
         ]
+        if data is not None:
+            headers.insert(2, ('Content-Length', "%d" % len(data)))
+        return headers
 
     def _make_burn_ctx_via_params(self, **kw):
         burn_options = request.env['dj.compilation'].dj_burn_options_flags
@@ -50,11 +54,19 @@ class DJ(http.Controller):
         """Burn one or more compilations at once.
 
         `compilations` string can be an ID or a list of IDs separated by comma.
+        Pass `format=tar` to get a gzipped tar instead of a zip file.
         """
         ids = string_to_list(compilation_ids, modifier=int)
         records = request.env['dj.compilation'].browse(ids)
         ctx = self._make_burn_ctx_via_params(**kwargs)
-        filename, content = records.with_context(**ctx).burn()
+        records = records.with_context(**ctx)
+        if kwargs.get('format') == 'tar':
+            filename, chunks = records.burn_tar_stream()
+            headers = self._make_download_headers(
+                None, filename, 'application/gzip')
+            return werkzeug.wrappers.Response(
+                chunks, headers=headers, direct_passthrough=True)
+        filename, content = records.burn()
         headers = self._make_download_headers(
             content, filename, 'application/zip')
         return request.make_response(content, headers=headers)
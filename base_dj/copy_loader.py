@@ -0,0 +1,293 @@
+# Copyright 2017 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+"""Load generated CSV files w/ PostgreSQL COPY instead of ORM `load`.
+
+Meant for plain configuration tables only:
+no computed stored field, no python constraint, no mail tracking,
+no translation...
+Use `copy_unsafe_reasons` to know if a model can be loaded this way.
+
+Generated songs use it like:
+
+    from odoo.addons.base_dj.copy_loader import load_csv_copy
+
+    load_csv_copy(ctx, model, 'install/generated/foo/res.bank.csv')
+
+Rows are written in one go:
+
+* record xmlids and relations' xmlids are resolved in bulk
+* ids are allocated for new records (so that rows can reference each other)
+* rows are COPY-ed into a temporary table
+* existing records are updated and new ones inserted from there
+* xmlids of new records are added to `ir_model_data`
+"""
+
+import csv
+import io
+import os
+
+from odoo import fields, models
+
+COPY_FIELD_TYPES = (
+    'char', 'text', 'selection', 'boolean', 'integer', 'float', 'monetary',
+    'date', 'datetime', 'many2one',
+)
+
+
+def copy_unsafe_reasons(model, field_names):
+    """Return the reasons why `model` cannot be loaded via COPY.
+
+    :param model: a recordset
+    :param field_names: CSV column names (like `name`, `partner_id/id`)
+    :return: list of messages, empty if loading via COPY is safe.
+    """
+    res = []
+    if not model._auto or model._inherits:
+        res.append('records are not stored in one plain table')
+    if model._parent_store:
+        res.append('parent store must be computed')
+    if 'message_ids' in model._fields:
+        res.append('changes are tracked by mail thread')
+    if model._constraints or model._constraint_methods:
+        res.append('python constraints must be checked')
+    computed = sorted(
+        name for name, field in model._fields.items()
+        if field.store and field.compute
+    )
+    if computed:
+        res.append('stored computed fields: %s' % ', '.join(computed))
+    # raw SQL writes would not recompute them
+    dependants = sorted(set(
+        '%s.%s' % (dependant.model_name, dependant.name)
+        for field in model._fields.values()
+        for dependant, __ in model._field_triggers[field]
+        if dependant.store and dependant.model_name != model._name
+    ))
+    if dependants:
+        res.append(
+            'stored fields of other models depend on it: %s'
+            % ', '.join(dependants))
+    for column in field_names:
+        if column == 'id':
+            continue
+        name = column.replace('/id', '')
+        field = model._fields.get(name)
+        if field is None:
+            res.append('unknown field: %s' % name)
+        elif (field.type not in COPY_FIELD_TYPES or not field.store or
+                not field.column_type or field.inherited or
+                field.company_dependent):
+            res.append('field not stored as plain column: %s' % name)
+        elif name in model._dj_file_fields_info():
+            res.append('field stored as file: %s' % name)
+        elif field.translate:
+            res.append('translatable field: %s' % name)
+    return res
+
+
+def _resolve_path(ctx, path):
+    if os.path.isabs(path):
+        return path
+    options = getattr(ctx, 'options', None)
+    base_path = (getattr(options, 'odoo_data_path', None) or
+                 os.environ.get('ODOO_DATA_PATH', ''))
+    return os.path.join(base_path, path)
+
+
+def load_csv_copy(ctx, model, path):
+    """Anthem loader: load a generated CSV file via COPY."""
+    with open(_resolve_path(ctx, path), 'r', encoding='utf-8',
+              newline='') as fd:
+        rows = csv.reader(fd)
+        header = next(rows)
+        return copy_records(model, header, rows)
+
+
+def _xmlids_lookup(cr, model_name, xmlids):
+    """Map `module.name` xmlids of given model to their ids."""
+    pairs = sorted(set(tuple(x.split('.', 1)) for x in xmlids if '.' in x))
+    res = {}
+    for sub_pairs in cr.split_for_in_conditions(pairs):
+        cr.execute("""
+            SELECT module, name, res_id
+            FROM ir_model_data
+            WHERE model = %s AND (module, name) IN %s
+        """, (model_name, sub_pairs))
+        res.update(
+            ('%s.%s' % (module, name), res_id)
+            for module, name, res_id in cr.fetchall()
+        )
+    return res
+
+
+def _to_column(field, value):
+    """Convert exported CSV string value to column value.
+
+    Empty values are stored like the ORM would: 0 for numbers,
+    false for booleans, NULL otherwise.
+    """
+    if value == '':
+        if field.type == 'boolean':
+            return False
+        if field.type == 'integer':
+            return 0
+        if field.type in ('float', 'monetary'):
+            return 0.0
+        return None
+    if field.type == 'boolean':
+        return value not in ('False', 'false', '0')
+    if field.type == 'integer':
+        return int(value)
+    if field.type in ('float', 'monetary'):
+        return float(value)
+    return value
+
+
+def copy_records(model, header, rows):
+    """Load exported rows into `model` table via COPY.
+
+    :param header: CSV header as generated by dj songs
+    :param rows: iterable of lists of strings
+    :return: ids of the records loaded
+    """
+    reasons = copy_unsafe_reasons(model, header)
+    if reasons:
+        raise ValueError(
+            'Cannot load %s via COPY: %s' % (model._name, '; '.join(reasons)))
+    if 'id' not in header:
+        raise ValueError(
+            'Cannot load %s via COPY: `id` column missing' % model._name)
+    cr = model.env.cr
+    table = model._table
+    rows = list(rows)
+    id_pos = header.index('id')
+    columns = [
+        (pos, model._fields[name.replace('/id', '')])
+        for pos, name in enumerate(header) if name != 'id'
+    ]
+
+    # records' ids: existing ones + new ones allocated from the sequence
+    xmlids = [row[id_pos] for row in rows]
+    existing = _xmlids_lookup(cr, model._name, xmlids)
+    if existing:
+        cr.execute(
+            'SELECT id FROM "{}" WHERE id IN %s'.format(table),
+            (tuple(set(existing.values())), ))
+        found = set(x[0] for x in cr.fetchall())
+        orphans = [x for x, rec_id in existing.items() if rec_id not in found]
+        if orphans:
+            raise ValueError(
+                'External IDs pointing to deleted records: %s'
+                % ', '.join(sorted(orphans)))
+    new_xmlids = sorted(set(x for x in xmlids if x not in existing))
+    ids = dict(existing)
+    if new_xmlids:
+        cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            ('%s_id_seq' % table, len(new_xmlids)))
+        ids.update(zip(new_xmlids, [x[0] for x in cr.fetchall()]))
+
+    # relations' ids, resolved in bulk per comodel
+    relations = {}
+    for pos, field in columns:
+        if field.type != 'many2one':
+            continue
+        comodel = field.comodel_name
+        relations.setdefault(comodel, set()).update(
+            row[pos] for row in rows if row[pos])
+    rel_ids = {}
+    for comodel, rel_xmlids in relations.items():
+        found = _xmlids_lookup(cr, comodel, rel_xmlids)
+        if comodel == model._name:
+            # rows can reference each other
+            found.update(ids)
+        missing = sorted(rel_xmlids.difference(found))
+        if missing:
+            raise ValueError(
+                'External IDs not found for %s: %s'
+                % (comodel, ', '.join(missing)))
+        rel_ids[comodel] = found
+
+    # stage rows
+    names = [field.name for __, field in columns]
+    stage_columns = ', '.join('"%s"' % x for x in ['id'] + names)
+    cr.execute(
+        'CREATE TEMP TABLE dj_copy_stage ON COMMIT DROP AS '
+        'SELECT {} FROM "{}" WITH NO DATA'.format(stage_columns, table))
+    cr.execute('ALTER TABLE dj_copy_stage ADD COLUMN dj_new boolean')
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        values = [ids[row[id_pos]]]
+        for pos, field in columns:
+            if field.type == 'many2one':
+                value = rel_ids[field.comodel_name].get(row[pos])
+            else:
+                value = _to_column(field, row[pos])
+            values.append(value)
+        values.append(row[id_pos] not in existing)
+        writer.writerow(values)
+    buf.seek(0)
+    cr.copy_expert(
+        'COPY dj_copy_stage ({}, dj_new) FROM STDIN WITH CSV'.format(
+            stage_columns), buf)
+
+    # update existing records
+    log_names = log_values = []
+    if model._log_access:
+        log_names = ['create_uid', 'create_date', 'write_uid', 'write_date']
+        uid = model.env.uid
+        now = fields.Datetime.now()
+        log_values = [uid, now, uid, now]
+    if names or log_names:
+        assign = ['"{0}" = s."{0}"'.format(x) for x in names]
+        assign += ['"%s" = %%s' % x for x in log_names[2:]]
+        cr.execute("""
+            UPDATE "{table}" SET {assign}
+            FROM dj_copy_stage s
+            WHERE "{table}".id = s.id AND NOT s.dj_new
+        """.format(table=table, assign=', '.join(assign)), log_values[2:])
+
+    # insert new records w/ defaults for missing columns
+    defaults = model.default_get([
+        name for name, field in model._fields.items()
+        if field.store and field.column_type and name not in names and
+        name not in models.MAGIC_COLUMNS
+    ])
+    default_names = sorted(defaults)
+    default_values = [
+        model._fields[name].convert_to_column(defaults[name], model)
+        for name in default_names
+    ]
+    cr.execute("""
+        INSERT INTO "{table}" ({columns})
+        SELECT {values}
+        FROM dj_copy_stage s
+        WHERE s.dj_new
+    """.format(
+        table=table,
+        columns=', '.join(
+            '"%s"' % x for x in ['id'] + names + default_names + log_names),
+        values=', '.join(
+            ['s."%s"' % x for x in ['id'] + names] +
+            ['%s' for x in default_names + log_names]),
+    ), default_values + log_values)
+    if new_xmlids:
+        cr.execute("""
+            INSERT INTO ir_model_data
+                (module, name, model, res_id, noupdate)
+            SELECT split_part(v.xmlid, '.', 1),
+                   substr(v.xmlid, strpos(v.xmlid, '.') + 1),
+                   %s, v.res_id, false
+            FROM (
+                SELECT unnest(%s::varchar[]) AS xmlid,
+                       unnest(%s::integer[]) AS res_id
+            ) v
+        """, (model._name, new_xmlids, [ids[x] for x in new_xmlids]))
+    cr.execute('DROP TABLE dj_copy_stage')
+
+    model.invalidate_cache()
+    # xmlids are cached
+    model.env['ir.model.data'].clear_caches()
+    return [ids[x] for x in xmlids]
@@ -0,0 +1,105 @@
+# Copyright 2017 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+"""Export song records for CSV files.
+
+Songs export flat columns only (`id`, `name`, `partner_id/id`...)
+hence we don't need the whole `export_data` machinery but we want:
+
+* real values of selection fields, not their labels
+* xmlids for relations, retrieved in bulk per model
+
+Converters are picked once per column from `DJ_EXPORT_CONVERTERS`
+so that fields are not patched and standard exports are not affected.
+"""
+
+import functools
+import itertools
+
+# records exported between cache invalidations, like `_export_rows`
+EXPORT_BATCH_SIZE = 1000
+
+
+def _selection_to_export(field, value, record):
+    """We want to export the real value of the field, not display value."""
+    return value if value else ''
+
+
+# field type -> function(field, value, record) returning exported value
+DJ_EXPORT_CONVERTERS = {
+    'selection': _selection_to_export,
+}
+
+
+def get_converter(field):
+    """Return function(value, record) converting `field` values."""
+    converter = DJ_EXPORT_CONVERTERS.get(field.type)
+    if converter is None:
+        return field.convert_to_export
+    return functools.partial(converter, field)
+
+
+def _parse_columns(model, field_names):
+    """Map CSV columns to `(field name, converter)`.
+
+    Relations have no converter as they are exported as xmlids.
+    """
+    res = []
+    for column in field_names:
+        if column in ('id', '.id'):
+            res.append((column, None))
+            continue
+        is_xmlid = column.endswith('/id')
+        fname = column[:-3] if is_xmlid else column
+        field = model._fields.get(fname)
+        if is_xmlid:
+            valid = field is not None and field.type in (
+                'many2one', 'many2many')
+        else:
+            valid = field is not None and not field.relational
+        if not valid:
+            raise ValueError(
+                'Cannot export column `%s` of `%s`' % (column, model._name))
+        res.append((fname, None if is_xmlid else get_converter(field)))
+    return res
+
+
+def export_rows(records, field_names):
+    """Export `records` like `export_data` does for given CSV columns.
+
+    :return: list of rows, one per record
+    """
+    model = records.browse()
+    columns = _parse_columns(model, field_names)
+    rows = []
+    for idx in range(0, len(records), EXPORT_BATCH_SIZE):
+        sub_records = records[idx:idx + EXPORT_BATCH_SIZE]
+        for record in sub_records:
+            row = []
+            for fname, converter in columns:
+                if fname == 'id':
+                    # converted to xmlid below
+                    row.append(record.id)
+                elif fname == '.id':
+                    row.append(str(record.id))
+                elif converter is None:
+                    # converted to xmlids below
+                    row.append(record[fname].ids)
+                else:
+                    row.append(converter(record[fname], record))
+            rows.append(row)
+        # keep memory stable
+        records.invalidate_cache(ids=sub_records.ids)
+    for pos, (fname, converter) in enumerate(columns):
+        if fname == 'id':
+            xmlids = records._dj_export_xmlids()
+            for row in rows:
+                row[pos] = xmlids[row[pos]]
+        elif fname != '.id' and converter is None:
+            comodel = model.env[model._fields[fname].comodel_name]
+            related_ids = set(itertools.chain.from_iterable(
+                row[pos] for row in rows))
+            xmlids = comodel.browse(list(related_ids))._dj_export_xmlids()
+            for row in rows:
+                row[pos] = ','.join(xmlids[x] for x in row[pos]) or False
+    return rows
@@ -4,14 +4,19 @@
 from odoo import api, models, tools
 import io
 import os
+import base64
 import codecs
+import functools
 import logging
 import mimetypes
+import mmap
 import hashlib
 import uuid
+from types import MappingProxyType
 
-from ..utils import is_xml, to_str, is_string, follow_record_field
+from ..utils import is_xml, to_str, is_string, follow_record_fields
 from ..slugifier import slugify
+from ..sql_export import SQL_EXPORT_TYPES
 
 ODOO_DATA_PATH = os.getenv('ODOO_DATA_PATH', '').rstrip('/')
 _logger = logging.getLogger(__file__)
@@ -25,6 +30,51 @@ def decode64(content):
     return codecs.decode(content, 'base64')
 
 
+# files bigger than this are never kept in cache when imported,
+# binary ones are memory-mapped
+DJ_FILE_MMAP_THRESHOLD = 1024 * 1024
+# max number of imported files contents kept in memory
+DJ_FILE_CACHE_SIZE = 128
+
+
+def read_dj_file(abs_path, binary=False):
+    """Read a `dj_path` file and return the value for the field.
+
+    Binary fields want base64 content.
+    """
+    stat = os.stat(abs_path)
+    if stat.st_size >= DJ_FILE_MMAP_THRESHOLD:
+        if binary:
+            return _read_dj_file_mapped(abs_path)
+        return _read_dj_file(abs_path, binary)
+    # the same file is often referenced by many records:
+    # `mtime` and `size` are there to read it again if it changes.
+    return _read_dj_file_cached(
+        abs_path, stat.st_mtime, stat.st_size, binary)
+
+
+def _read_dj_file(abs_path, binary):
+    if not binary:
+        with open(abs_path, 'r') as ff:
+            return ff.read()
+    with open(abs_path, 'rb') as ff:
+        return encode64(ff.read())
+
+
+def _read_dj_file_mapped(abs_path):
+    with open(abs_path, 'rb') as ff:
+        # encode straight from the mapped pages
+        # w/out loading a copy of the whole file first
+        with mmap.mmap(ff.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return base64.encodebytes(view)
+
+
+@functools.lru_cache(maxsize=DJ_FILE_CACHE_SIZE)
+def _read_dj_file_cached(abs_path, mtime, size, binary):
+    return _read_dj_file(abs_path, binary)
+
+
 class Base(models.AbstractModel):
 
     _inherit = 'base'
@@ -44,13 +94,9 @@ class Base(models.AbstractModel):
         """
         return self.env.context.get('dj_xmlid_module') or '__setup__'
 
-    @tools.ormcache('self', 'key')
     def _dj_global_config(self, key=None):
         """Retrieve default global config for xmlid fields."""
-        config = self.env['dj.equalizer'].search([
-            ('model', '=', self._name),
-        ], limit=1)
-        return config.get_conf(key)
+        return self.env['dj.equalizer'].get_model_conf(self._name, key=key)
 
     @tools.ormcache('self')
     def _dj_xmlid_export_name(self):
@@ -61,48 +107,83 @@ class Base(models.AbstractModel):
         to be used for xmlid generation.
         Strings will be normalized.
         """
-        name = [
-            self._table, str(self.id),
-            uuid.uuid4().hex[:8],
-        ]  # std odoo default
+        return self._dj_compute_xmlid_names()[self.id]
+
+    def _dj_xmlid_fields(self, global_config):
+        """Return field names used to generate xmlids."""
         mapping = self.env.context.get('dj_xmlid_fields_map') or {}
-        global_config = self._dj_global_config()
         xmlid_fields = (mapping.get(self._name, []) or
                         global_config.get('xmlid_fields', []))
         if not xmlid_fields and 'name' in self:
             # No specific configuration: we assume we can use name as default
-            xmlid_fields.append('name')
-        if xmlid_fields:
-            name = [self._table, ]
-            if global_config.get('xmlid_table_name'):
-                name = [global_config['xmlid_table_name'], ]
-            xmlid_fields_name = []
-            for key in xmlid_fields:
-                if '.' in key:
-                    val = follow_record_field(self, key)
-                elif self[key]:
-                    val = self[key]
-                else:
-                    continue
-                value = to_str(val, safe=True)
-                if isinstance(value, str):
-                    value = slugify(value).replace('-', '_')
-                elif isinstance(value, models.BaseModel):
-                    value = slugify(value.display_name).replace('-', '_')
-                elif isinstance(value, (int, float)):
-                    value = str(value)
-                xmlid_fields_name.append(value)
-            if global_config.get('xmlid_policy') == 'hash':
-                # sometime this is the only way to get unique xmlids
-                # (ir.default for instance).
-                name.append(self._hash_them(tuple(xmlid_fields_name)))
+            xmlid_fields = ['name', ]
+        return xmlid_fields
+
+    def _dj_xmlid_export_names(self):
+        """Retrieve xmlid names for all the records at once.
+
+        :return: dictionary `{record id: xmlid name}`
+        """
+        if not self._dj_xmlid_fields(self._dj_global_config()):
+            # random names: make sure we always get the same one
+            return {rec.id: rec._dj_xmlid_export_name() for rec in self}
+        return self._dj_compute_xmlid_names()
+
+    @staticmethod
+    def _dj_xmlid_value(val):
+        """Normalize a value to be used inside an xmlid."""
+        value = to_str(val, safe=True)
+        if isinstance(value, str):
+            value = slugify(value).replace('-', '_')
+        elif isinstance(value, models.BaseModel):
+            value = slugify(value.display_name).replace('-', '_')
+        elif isinstance(value, (int, float)):
+            value = str(value)
+        return value
+
+    def _dj_compute_xmlid_names(self):
+        global_config = self._dj_global_config()
+        xmlid_fields = self._dj_xmlid_fields(global_config)
+        # nested fields are resolved for all the records in one go
+        followed = follow_record_fields(
+            self, [key for key in xmlid_fields if '.' in key])
+        prefix = global_config.get('xmlid_table_name') or self._table
+        multicompany = (self.env.context.get('dj_multicompany') and
+                        'company_id' in self)
+        is_hash = global_config.get('xmlid_policy') == 'hash'
+        akas = {}
+        res = {}
+        for rec in self:
+            if not xmlid_fields:
+                name = [
+                    self._table, str(rec.id),
+                    uuid.uuid4().hex[:8],
+                ]  # std odoo default
             else:
-                name.extend(xmlid_fields_name)
-        if (self.env.context.get('dj_multicompany') and
-                'company_id' in self and self.company_id.aka):
-            # discriminate by company `aka` code
-            name.insert(0, self.company_id.normalized_aka())
-        return '_'.join(name)
+                name = [prefix, ]
+                xmlid_fields_name = []
+                for key in xmlid_fields:
+                    if '.' in key:
+                        val = followed[rec.id][key]
+                    elif rec[key]:
+                        val = rec[key]
+                    else:
+                        continue
+                    xmlid_fields_name.append(self._dj_xmlid_value(val))
+                if is_hash:
+                    # sometime this is the only way to get unique xmlids
+                    # (ir.default for instance).
+                    name.append(self._hash_them(tuple(xmlid_fields_name)))
+                else:
+                    name.extend(xmlid_fields_name)
+            if multicompany and rec.company_id.aka:
+                # discriminate by company `aka` code
+                company = rec.company_id
+                if company.id not in akas:
+                    akas[company.id] = company.normalized_aka()
+                name.insert(0, akas[company.id])
+            res[rec.id] = '_'.join(name)
+        return res
 
     def _dj_export_xmlid(self):
         """Shortcut to force dj xmlid generation on 1 record."""
@@ -111,6 +192,14 @@ class Base(models.AbstractModel):
         # we get a generator w/ tuple(record, xid)
         return tuple(res)[0][1]
 
+    def _dj_export_xmlids(self):
+        """Force dj xmlid generation on all records at once.
+
+        :return: dictionary `{record id: xmlid}`
+        """
+        res = self.with_context(dj_export=1)._BaseModel__ensure_xml_id()
+        return {record.id: xid for record, xid in res}
+
     _dj_replaceable_modnames = (
         '__sample__', '__setup__', '__test__',
         '__import__', '__export__',
@@ -138,11 +227,14 @@ class Base(models.AbstractModel):
             WHERE model = %s AND res_id in %s
         """
         cr = self.env.cr
-        cr.execute(query, (self._name, tuple(self.ids)))
-        return {
-            res_id: (module, name)
-            for res_id, module, name in cr.fetchall()
-        }
+        res = {}
+        for sub_ids in cr.split_for_in_conditions(self.ids):
+            cr.execute(query, (self._name, sub_ids))
+            res.update(
+                (res_id, (module, name))
+                for res_id, module, name in cr.fetchall()
+            )
+        return res
 
     def _BaseModel__ensure_xml_id(self, skip=False):
         """Customize xmlid creation.
@@ -172,13 +264,12 @@ class Base(models.AbstractModel):
             (module, name) = xids[record_id]
             return ('%s.%s' % (module, name)) if module else name
 
-        def make_xid(r):
-            # call `_dj_xmlid_export_name` and keep the context
-            # which is very important for xid policy
-            return r.with_context(self.env.context)._dj_xmlid_export_name()
+        force = self.env.context.get('dj_xmlid_force')
+        # names are computed in one go, for all the records that need them
+        names = self._dj_xmlid_export_names() if force else {}
 
         def is_missing(r):
-            if not self.env.context.get('dj_xmlid_force'):
+            if not force:
                 return r.id not in xids
             # in case we are re-generating xids
             # replace only xids w/ replaceable mod names
@@ -186,7 +277,7 @@ class Base(models.AbstractModel):
             replaceable = xid_modname in self._dj_replaceable_modnames
             return (
                 not xid_modname or replaceable and
-                to_xid(r.id) != '{}.{}'.format(modname, make_xid(r))
+                to_xid(r.id) != '{}.{}'.format(modname, names[r.id])
             )
 
         # create missing xml ids
@@ -198,8 +289,10 @@ class Base(models.AbstractModel):
                 for record in self
             )
 
+        if not force:
+            names = missing._dj_xmlid_export_names()
         xids.update(
-            (r.id, (modname, r._dj_xmlid_export_name())) for r in missing
+            (r.id, (modname, names[r.id])) for r in missing
         )
         # you can generate one shot xids and not store them
         # so you don't pollute your db and maybe fix some csv
@@ -252,8 +345,15 @@ class Base(models.AbstractModel):
             return
         if _fields is None:
             _fields = list(records[0].keys())
-        for fname, info in self._dj_special_fields(_fields):
+        special = self._dj_special_fields(_fields)
+        for fname, info in special:
             self._dj_handle_file_field_read(fname, info, records)
+        if special:
+            # wipe cache once for all the records handled
+            # otherwise we gonna get the std value in any case
+            self.invalidate_cache(
+                [fname for fname, __ in special],
+                [rec['id'] for rec in records])
 
     # you can customized this per-model
     _dj_file_fields_types = ('html', 'binary', )
@@ -270,29 +370,84 @@ class Base(models.AbstractModel):
         whitelist = []
         if self.env.context.get('dj_export'):
             whitelist = self.env.context.get('dj_export_model_fields', [])
+        file_fields = self._dj_file_fields_info()
+        if _fields is None:
+            _fields = file_fields.keys()
         res = []
-        fields_info = self.fields_get(_fields)
-        for fname, info in fields_info.items():
+        for fname in _fields:
             if whitelist and fname not in whitelist:
                 continue
-            if self._dj_is_file_field(fname, info):
-                res.append((fname, info))
+            if fname in file_fields:
+                res.append((fname, file_fields[fname]))
         return res
 
     def _dj_is_file_field(self, fname, info):
         return (info['type'] in self._dj_file_fields_types or
                 fname in self._dj_file_fields_names)
 
+    @tools.ormcache()
+    def _dj_file_fields_info(self):
+        """Map file fields to their info, once per model and registry."""
+        res = {}
+        for fname, field in self._fields.items():
+            info = MappingProxyType({'type': field.type})
+            if self._dj_is_file_field(fname, info):
+                res[fname] = info
+        return MappingProxyType(res)
+
+    def _dj_field_info(self, fname):
+        return (self._dj_file_fields_info().get(fname) or
+                {'type': self._fields[fname].type})
+
+    def _dj_sql_export_columns(self, columns):
+        """Return CSV columns that can be exported via SQL.
+
+        Override it to exclude columns whose value is converted on read.
+        """
+        file_fields = self._dj_file_fields_info()
+        res = []
+        for column in columns:
+            is_xmlid = column.endswith('/id')
+            fname = column[:-3] if is_xmlid else column
+            field = self._fields.get(fname)
+            if (field is None or fname in file_fields or not field.store or
+                    field.compute or field.inherited or field.translate or
+                    field.company_dependent):
+                continue
+            if is_xmlid:
+                qualified = field.type in ('many2one', 'many2many')
+            else:
+                qualified = (field.type in SQL_EXPORT_TYPES and
+                             bool(field.column_type))
+            if qualified:
+                res.append(column)
+        return res
+
     def _dj_handle_file_field_read(self, fname, info, records):
+        with_value = self.browse([rec['id'] for rec in records if rec[fname]])
+        paths = with_value._dj_files_to_paths(fname, info=info)
         for rec in records:
-            ob = self.browse(rec['id'])
-            self.invalidate_cache([fname])
             if rec[fname]:
-                rec[fname] = self._dj_file_to_path(ob, fname, info)
+                rec[fname] = paths[rec['id']]
 
-    def _dj_file_to_path(self, rec, fname, info=None, bare_path=False):
-        info = info or self.fields_get([fname])[fname]
-        xmlid = rec._dj_export_xmlid()
+    def _dj_files_to_paths(self, fname, info=None, bare_path=False):
+        """Batch version of `_dj_file_to_path` for current records.
+
+        :return: dictionary `{record id: path}`
+        """
+        info = info or self._dj_field_info(fname)
+        xmlids = self._dj_export_xmlids()
+        return {
+            rec.id: self._dj_file_to_path(
+                rec, fname, info=info, bare_path=bare_path,
+                xmlid=xmlids[rec.id])
+            for rec in self
+        }
+
+    def _dj_file_to_path(self, rec, fname, info=None, bare_path=False,
+                         xmlid=None):
+        info = info or self._dj_field_info(fname)
+        xmlid = xmlid or rec._dj_export_xmlid()
         path = '{prefix}{binaries_path}/{xmlid}__{fname}'
         bin_path = self.env.context.get('dj_export_binaries_path', 'binaries')
         export_lang = self.env.context.get('dj_export_lang', '')
@@ -314,7 +469,7 @@ class Base(models.AbstractModel):
         content = record[fname]
         if fname == 'arch_db':
             return 'xml', content
-        info = info or self.fields_get([fname])[fname]
+        info = info or self._dj_field_info(fname)
         if info['type'] == 'html':
             return 'html', content
         # guess filename from mimetype
@@ -390,14 +545,7 @@ class Base(models.AbstractModel):
         path = path[len(self._dj_path_prefix):]
         base_path = ODOO_DATA_PATH
         abs_path = os.path.join(base_path, path)
-        read_mode = 'r'
-        if info['type'] == 'binary':
-            read_mode = 'rb'
-        with open(abs_path, read_mode) as ff:
-            content = ff.read()
-            if info['type'] == 'binary':
-                content = encode64(content)
-            return content
+        return read_dj_file(abs_path, binary=info['type'] == 'binary')
 
     @api.model
     def create(self, vals):
@@ -11,7 +11,15 @@ import os
 from urllib.parse import urlencode
 
 from odoo import models, fields, api, exceptions, _
-from ...utils import create_zipfile, make_title, to_str
+from ...utils import (
+    make_title,
+    to_str,
+    toposort,
+    toposort_stages,
+    strongly_connected_components,
+    DependencyCycleError,
+)
+from ...sinks import ZipSink, TarSink, DirectorySink
 from ...slugifier import slugify
 
 
@@ -72,6 +80,19 @@ class Compilation(models.Model):
              'they are the base for every compilation. '
              'You can turn off this behavior by enabling this flag.'
     )
+    auto_order = fields.Boolean(
+        string='Order songs by relations?',
+        help='Play songs after the songs loading the models '
+             'they point to, whatever their sequence. '
+             'Relations between models pointing to each other '
+             'are loaded in a second pass.'
+    )
+    parallel_stages = fields.Boolean(
+        string='Burn parallel execution plan?',
+        help='Add `PRE_STAGES` and `POST_STAGES` to the disc: '
+             'songs grouped in stages that depend only on previous stages. '
+             'Songs in the same stage can be played concurrently.'
+    )
     sanity_check = fields.Html(compute='_compute_info')
     global_info = fields.Html(compute='_compute_info')
 
@@ -189,8 +210,42 @@ class Compilation(models.Model):
             'pre_songs': songs.filtered(lambda x: x.exec_hook == 'pre'),
             'post_songs': songs.filtered(lambda x: x.exec_hook == 'post'),
         })
+        if self.parallel_stages:
+            for hook in ('pre', 'post'):
+                stages = self._get_songs_stages(
+                    values[hook + '_songs'])
+                values[hook + '_stages'] = [
+                    [song.name for song in stage] for stage in stages
+                ]
         return values
 
+    def _get_songs_stages(self, songs):
+        """Group songs in stages that can be played concurrently.
+
+        Songs keep their order and a song depends on previous songs:
+
+        * that are its master songs
+        * that load the same model
+        * that load a model referenced by its CSV columns
+        * if any of them has no records to load (eg: settings)
+
+        :return: list of stages (lists of songs)
+        """
+        songs = [x for x in songs if not x.scratchable()]
+        dependencies = {}
+        for i, song in enumerate(songs):
+            masters = song.depends_on_ids.mapped('master_song_id')
+            related = song._get_related_models()
+            dependencies[i] = [
+                j for j, prev in enumerate(songs[:i])
+                if not (song.has_records and prev.has_records) or
+                prev in masters or
+                prev.model_name == song.model_name or
+                prev.model_name in related
+            ]
+        stages = toposort_stages(range(len(songs)), dependencies)
+        return [[songs[i] for i in stage] for stage in stages]
+
     def _is_multicompany_env(self):
         return bool(self.env['res.company'].search_count([]) > 1)
 
@@ -214,61 +269,177 @@ class Compilation(models.Model):
     def _get_installed_langs(self):
         return self.env['res.lang'].get_installed()
 
-    def _get_all_songs(self):
-        songs = self.env['dj.song'].browse()
-        for song in self.mapped('song_ids'):
-            songs |= song
+    @api.multi
+    def play_songs_onchanges(self):
+        """Play deferred songs' onchanges in one pass per compilation."""
+        for comp in self:
+            comp.with_context(active_test=False).song_ids.filtered(
+                'onchanges_pending').play_all_onchanges()
+
+    def _get_songs_playlist(self):
+        """Return songs to play along w/ their shadow songs.
+
+        :return: list of tuples `(song, translations, others)`
+            where `translations` are the shadow songs per lang
+            and `others` any other shadow song to play after them.
+        """
+        self.play_songs_onchanges()
+        empty = self.env['dj.song'].browse()
+        dependencies = {}
+        for comp in self.filtered('auto_order'):
+            models_dependencies = comp._get_models_graph()[0]
+            for song in comp.song_ids:
+                models = models_dependencies.get(song.model_name, ())
+                dependencies[song.id] = comp.song_ids.filtered(
+                    lambda x: x.model_name in models).ids
+        res = []
+        songs = self.mapped('song_ids')._sorted_by_dependencies(dependencies)
+        # reset stale dependant domains once, masters first
+        songs._refresh_dependant_domain()
+        # before the disc gets rendered w/ songs' templates
+        songs._switch_heavy_import()
+        for song in songs:
+            translations = others = empty
             if song.export_translations:
-                songs |= self._add_shadow_song_translations(song)
+                translations = self._add_shadow_song_translations(song)
             if song.song_type == 'load_csv_defer_parent':
-                songs |= self._add_shadow_song_compute_parent(song)
+                others = self._add_shadow_song_compute_parent(song)
+            res.append((song, translations, others))
+        return res
+
+    def _get_models_graph(self):
+        """Analyze relations between models loaded by songs.
+
+        Computed once per burn: see `get_all_tracks`.
+
+        Songs of core compilations are considered as played first.
+        Models pointing to each other are sorted by their required
+        relations: other relations pointing to models loaded later
+        must be loaded in a second pass.
+
+        :return: tuple `(dependencies, cyclic)` where `dependencies`
+            maps models to the models to load before them
+            and `cyclic` maps models to the CSV columns to load later.
+        """
+        self.ensure_one()
+        graphs = self.env.context.get('dj_models_graphs')
+        if graphs is not None and self.id in graphs:
+            return graphs[self.id]
+        res = self._compute_models_graph()
+        if graphs is not None:
+            graphs[self.id] = res
+        return res
+
+    def _compute_models_graph(self):
+        core = self._get_core_compilations() - self
+        songs = core.mapped('song_ids') | self.song_ids
+        models = []
+        relations = {}
+        for song in songs.filtered('has_records'):
+            if song.model_name not in relations:
+                models.append(song.model_name)
+                relations[song.model_name] = {}
+            for column, comodel in song._get_csv_relations().items():
+                required = song.song_model._fields[column[:-3]].required
+                relations[song.model_name][column] = (comodel, required)
+        all_deps = {
+            model: [comodel for comodel, __ in rels.values()]
+            for model, rels in relations.items()
+        }
+        required_deps = {
+            model: [comodel for comodel, req in rels.values() if req]
+            for model, rels in relations.items()
+        }
+        dependencies = {}
+        cyclic = {}
+        for component in strongly_connected_components(models, all_deps):
+            try:
+                ordered = toposort(component, required_deps)
+            except DependencyCycleError as err:
+                raise exceptions.UserError(
+                    _('Circular dependency between required fields '
+                      'of models: %s') % ', '.join(err.nodes))
+            position = {model: i for i, model in enumerate(ordered)}
+            for model in ordered:
+                for column, (comodel, __) in sorted(relations[model].items()):
+                    if comodel == model or comodel not in relations:
+                        # self relations are always loaded in 2 steps
+                        continue
+                    if position.get(comodel, -1) > position[model]:
+                        cyclic.setdefault(model, []).append(column)
+                    else:
+                        dependencies.setdefault(model, set()).add(comodel)
+        return dependencies, cyclic
+
+    def _get_all_songs(self):
+        # playlist is computed once per burn: see `_get_tracks`
+        playlist = self.env.context.get('dj_songs_playlist')
+        if playlist is None:
+            playlist = self._get_songs_playlist()
+        songs = self.env['dj.song'].browse()
+        for song, translations, others in playlist:
+            songs |= song | translations | others
         return songs
 
     def _add_shadow_song_translations(self, song):
         songs = self.env['dj.song'].browse()
+        langs = [
+            lang_code for lang_code, __ in self._get_installed_langs()
+            # we assume English is always the main lang
+            # and we import/export value in English
+            if lang_code != 'en_US'
+        ]
+        if not langs:
+            return songs
+        song_data = song.copy_data(default={
+            'export_translations': False,
+            'sequence': song.sequence + 1,
+        })[0]
+        filepath, ext = os.path.splitext(song.csv_path)
         # inject shadow song per each lang
-        for lang_code, __ in self._get_installed_langs():
-            if lang_code == 'en_US':
-                # we assume English is always the main lang
-                # and we import/export value in English
-                continue
-            filepath, ext = os.path.splitext(song.csv_path)
-            defaults = {
-                'export_translations': False,
-                'export_lang': lang_code,
-                'model_context': "{'lang': '%s'}" % lang_code,
+        for lang_code in langs:
+            translated_data = dict(
+                song_data,
+                export_lang=lang_code,
+                model_context="{'lang': '%s'}" % lang_code,
                 # set path as foo/bar/my.model.fr_FR.csv
-                'csv_path': filepath + '.' + lang_code + ext,
-                'sequence': song.sequence + 1,
-            }
-            translated_data = song.copy_data(default=defaults)[0]
+                csv_path=filepath + '.' + lang_code + ext,
+            )
             # add `shadow song` for each lang
             songs |= song.new(translated_data)
         return songs
 
     def _add_shadow_song_compute_parent(self, song):
-        # inject shadow song to compute parents
-        song_data = song.copy_data()[0]
-        # just clone the song and inject one to render
-        # compute parents after that
+        # inject shadow song to compute parents after loading records.
+        # It only needs to know the model: no need to clone the whole song.
         # TODO: a bit hacky... When we move song types to separated records
         # we could have shadow song types and use them on the fly.
-        song_data['song_type'] = 'compute_parent'
         types = self.env['dj.song'].available_song_types
-        song_data.update(types['compute_parent'].get('defaults', {}))
+        song_data = dict(
+            types['compute_parent'].get('defaults', {}),
+            compilation_id=song.compilation_id.id,
+            model_id=song.model_id.id,
+            sequence=song.sequence,
+            song_type='compute_parent',
+        )
         return song.new(song_data)
 
     @api.multi
     def _get_tracks(self):
         """Collect files to burn from all compilations."""
         files = []
-        songs = self._get_all_songs()
+        playlist = self._get_songs_playlist()
         for comp in self:
-            files.append(comp.burn_disc())
-        for song in songs:
-            track = song.burn_track()
-            if track:
-                files.extend(track)
+            comp_playlist = [
+                x for x in playlist if x[0].compilation_id == comp]
+            files.append(comp.with_context(
+                dj_songs_playlist=comp_playlist).burn_disc())
+        for song, translations, others in playlist:
+            files.extend(song.burn_track() or [])
+            if translations:
+                files.extend(song.burn_translations_tracks(translations))
+            for other in others:
+                files.extend(other.burn_track() or [])
 
         # add __init__..py to song folders
         mid_path = comp.disc_full_path().rsplit('/', 1)[0]
@@ -297,7 +468,12 @@ class Compilation(models.Model):
         compilations = self
         if include_core:
             compilations |= self._get_core_compilations()
-        return compilations._get_tracks()
+        # share models' graph between all the songs of a compilation
+        # and master songs' records between their dependants
+        return compilations.with_context(
+            dj_models_graphs={},
+            dj_master_ids={},
+        )._get_tracks()
 
     def disc_full_path(self):
         path = self.disc_path.format(**self.read()[0])
@@ -326,27 +502,65 @@ class Compilation(models.Model):
         return 'DEV_README.rst', template.render(compilations=self)
 
     @api.multi
-    def burn(self):
-        """Burn disc into a zip file."""
+    def _get_burn_tracks(self):
+        """Collect all the tracks to burn for current compilations."""
         # at least one of the compilations requires to exclude core ones
         exclude_core = (
             any(self.mapped('exclude_core')) or
             self.env.context.get('dj_exclude_core')
         )
-        files = self.with_context(
+        return self.with_context(
             # pass around the IDS the we are asked to burn.
             # Used in export self config for instance.
             dj_burning_ids=self.ids
         ).get_all_tracks(include_core=not exclude_core)
-        zf = create_zipfile(files)
+
+    @api.multi
+    def burn(self):
+        """Burn disc into a zip file."""
+        zf = self.burn_to(ZipSink())
         filename = self.make_album_title()
         return filename, zf.read()
 
-    def make_album_title(self):
+    @api.multi
+    def burn_tar(self, fileobj=None):
+        """Burn disc into a gzipped tar stream."""
+        stream = self.burn_to(TarSink(fileobj=fileobj))
+        filename = self.make_album_title(ext='tar.gz')
+        return filename, stream
+
+    @api.multi
+    def burn_tar_stream(self):
+        """Burn disc into an iterator over gzipped tar data.
+
+        Tracks are collected right away, compression happens on iteration.
+        """
+        tracks = self._get_burn_tracks()
+        filename = self.make_album_title(ext='tar.gz')
+        return filename, TarSink.iter_burn(tracks)
+
+    @api.multi
+    def burn_to(self, sink):
+        """Burn disc into given sink. See `base_dj.sinks`."""
+        return sink.burn(self._get_burn_tracks())
+
+    @api.multi
+    def burn_to_directory(self, path, only_changed=True):
+        """Burn disc straight into a directory, like your project checkout.
+
+        :param path: the directory where you would unpack the zip file.
+        :param only_changed: touch only the files whose content changed.
+        :return: the sink, holding `written` and `skipped` paths.
+        """
+        sink = DirectorySink(path, only_changed=only_changed)
+        self.burn_to(sink)
+        return sink
+
+    def make_album_title(self, ext='zip'):
         name = ['mutiple_compilations', ]
         if len(self) == 1:
             name = [self.name, self.data_mode]
-        return make_title('_'.join(name))
+        return make_title('_'.join(name), ext=ext)
 
     def anthem_path(self):
         path = self.disc_full_path().replace('/', '.').replace('.py', '')
@@ -1,14 +1,18 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.tools.safe_eval import safe_eval
 from collections import OrderedDict
+from types import MappingProxyType
 from ...utils import string_to_list
 
 
 class OrderedContext(OrderedDict):
 
+    def copy(self):
+        return OrderedContext(self)
+
     def __str__(self):
         return str(dict(self))
 
@@ -70,8 +74,8 @@ class DJEqualizer(models.Model):
             self.record_blacklist,
             modifier=lambda x: self.env.ref(x).id)
 
-    def get_conf(self, key=None):
-        all_keys = {
+    def _compute_conf(self):
+        return {
             'xmlid_fields': self.get_xmlid_fields(),
             'xmlid_policy': self.xmlid_policy,
             'xmlid_table_name': self.xmlid_table_name,
@@ -79,4 +83,68 @@ class DJEqualizer(models.Model):
             'field_blacklist': self.get_field_blacklist(),
             'record_blacklist': self.get_record_blacklist(),
         }
+
+    def get_conf(self, key=None):
+        all_keys = self._compute_conf()
         return all_keys.get(key, all_keys)
+
+    @staticmethod
+    def _freeze_conf(conf):
+        for k, v in conf.items():
+            if isinstance(v, list):
+                conf[k] = tuple(v)
+        return MappingProxyType(conf)
+
+    @tools.ormcache()
+    def _get_conf_index(self):
+        """Load all equalizers into an immutable `model -> config` map.
+
+        Loaded once per registry, invalidated when equalizers change.
+        """
+        index = {}
+        for config in self.sudo().search([]):
+            # like a `search` w/ `limit=1`: the 1st config wins
+            if config.model not in index:
+                index[config.model] = self._freeze_conf(config._compute_conf())
+        return MappingProxyType(index)
+
+    @tools.ormcache()
+    def _get_default_conf(self):
+        """Configuration shared by models w/ no equalizer."""
+        # same values as an empty recordset
+        return self._freeze_conf(self.browse()._compute_conf())
+
+    @api.model
+    def get_model_conf(self, model, key=None):
+        """Retrieve configuration for given model name.
+
+        Same as `get_conf` but w/ no query, thanks to the index.
+        You get a copy of the values, feel free to modify it.
+        """
+        conf = self._get_conf_index().get(model)
+        if conf is None:
+            conf = self._get_default_conf()
+        all_keys = {
+            k: v.copy() if isinstance(v, dict) else (
+                list(v) if isinstance(v, tuple) else v)
+            for k, v in conf.items()
+        }
+        return all_keys.get(key, all_keys)
+
+    @api.model
+    def create(self, vals):
+        res = super(DJEqualizer, self).create(vals)
+        self.clear_caches()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(DJEqualizer, self).write(vals)
+        self.clear_caches()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(DJEqualizer, self).unlink()
+        self.clear_caches()
+        return res
@@ -2,23 +2,32 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
 from odoo import models, fields, api, exceptions, tools, _
+from odoo.osv import expression
 from odoo.tools.safe_eval import safe_eval, test_python_expr
-from odoo.modules import get_module_path
 from ...utils import (
     csv_from_data,
-    force_company,
     context_to_string,
     to_str,
     string_to_list,
+    toposort,
+    DependencyCycleError,
+    get_module_repo,
 )
+from ...copy_loader import copy_unsafe_reasons
+from ...exporter import export_rows
+from ...sql_export import export_rows as sql_export_rows
 from ...config import (
     SPECIAL_FIELDS,
     SONG_TYPES,
     DEFAULT_PYTHON_CODE,
+    HEAVY_IMPORT_THRESHOLD,
+    HEAVY_IMPORT_CHUNK_SIZE,
 )
 from collections import defaultdict, Counter
+import logging
 import os
 
+_logger = logging.getLogger(__name__)
 testing = tools.config.get('test_enable') or os.environ.get('ODOO_TEST_ENABLE')
 
 
@@ -88,6 +97,18 @@ class Song(models.Model):
     binaries_path = fields.Char(
         default='{data_mode}/generated/{genre}/{comp_name}/binaries/{model}'
     )
+    chunk_size = fields.Integer(
+        help="Split CSV data in files of this amount of records "
+             "loaded and committed one by one. 0 means no split.",
+        default=0,
+    )
+    sql_export = fields.Boolean(
+        string='Fast SQL export',
+        help="Read stored columns and relations straight from the DB "
+             "instead of going through the ORM export. "
+             "Useful for big models w/ simple fields.",
+        default=False,
+    )
     domain = fields.Char(default="[]")
     python_code = fields.Text(
         default=DEFAULT_PYTHON_CODE,
@@ -117,6 +138,11 @@ class Song(models.Model):
         comodel_name='dj.song.dependency',
         inverse_name='song_id',
     )
+    depends_domain_outdated = fields.Boolean(
+        readonly=True,
+        copy=False,
+        help="A master song has changed since the last burn.",
+    )
     involved_modules = fields.Html(compute='_compute_involved_modules')
     position_in_collection = fields.Integer(
         compute='_compute_position_in_collection',
@@ -124,6 +150,17 @@ class Song(models.Model):
     )
     export_translations = fields.Boolean(default=False)
     export_lang = fields.Char()
+    onchanges_pending = fields.Boolean(
+        readonly=True,
+        copy=False,
+        help="Onchanges have been deferred at creation "
+             "and must be played before burning this song.",
+    )
+    onchanges_keep_fields = fields.Char(
+        readonly=True,
+        copy=False,
+        help="Fields set at creation: deferred onchanges won't touch them.",
+    )
     exec_hook = fields.Selection(
         selection=[('pre', 'pre'), ('post', 'post')],
         default='post',
@@ -138,6 +175,22 @@ class Song(models.Model):
                 if x.id == item.id
             ][0]
 
+    @api.constrains('song_type', 'model_id', 'model_fields_ids')
+    def _check_copy_song(self):
+        for song in self.filtered(lambda x: x.song_type == 'load_csv_copy'):
+            song._check_copy_safe(exceptions.ValidationError)
+
+    def _check_copy_safe(self, exc_class=exceptions.UserError):
+        """Make sure song's model can be loaded via COPY."""
+        if self.song_model is None:
+            return
+        reasons = copy_unsafe_reasons(
+            self.song_model, self.get_csv_field_names())
+        if reasons:
+            raise exc_class(
+                _('Model `%s` cannot be loaded via COPY:\n%s') % (
+                    self.model_name, '\n'.join(reasons)))
+
     @api.constrains('python_code')
     def _check_python_code(self):
         for song in self.filtered('python_code'):
@@ -166,30 +219,130 @@ class Song(models.Model):
 
     @api.onchange('depends_on_ids')
     def onchange_depends_on_ids(self):
-        """Collect record IDS from master songs and update domain."""
+        """Reset the domain listing records collected from master songs.
+
+        Master songs' records are matched when the domain gets evaluated:
+        see `_get_dependency_domain`.
+        """
+        if self._has_dependant_ids_domain():
+            self.domain = '[]'
+
+    def _get_dependant_domain(self, master_ids_cache=None):
+        """Build the domain matching records collected from master songs.
+
+        Dependencies supporting subqueries are left out:
+        see `_get_dependant_subquery_leaves`.
+
+        :param master_ids_cache: dictionary to share master records' ids
+            between dependant songs. Defaults to `dj_master_ids` ctx key.
+        """
+        if master_ids_cache is None:
+            master_ids_cache = self.env.context.get('dj_master_ids', {})
+        listed = self.depends_on_ids.filtered(
+            lambda x: not x._get_subquery_field())
+        if not listed:
+            return None
         ids = set([])
+        for dep in listed:
+            key = dep._dependant_cache_key()
+            if key not in master_ids_cache:
+                master_ids_cache[key] = dep._get_dependant_record_ids()
+            ids.update(master_ids_cache[key])
+        return [('id', 'in', sorted(ids))]
+
+    def _get_dependant_subquery_leaves(self):
+        """Return `inselect` leaves for master songs' records.
+
+        The db collects the ids instead of listing them in the domain.
+        Leaves are built when the domain gets evaluated
+        and never stored: they hold raw SQL params
+        and the record rules of current user.
+        """
+        leaves = []
         for dep in self.depends_on_ids:
-            ids.update(dep._get_dependant_record_ids())
-        if not ids:
-            return
-        # NOTE: we can end up w/ duplicated domain leafs
-        # as there's no easy way (or odoo util AFAIK)
-        # to merge existing domains.
-        # Eg: ['&', ('id', 'in', [125]), ('id', 'in', [125])]
-        # So, here we just ignore existing domain
-        # assuming that if you want to play w/ the domain
-        # you gonna do it *after* playing w/ song dependencies.
-        self.domain = str([('id', 'in', list(ids))])
+            subquery = dep._get_dependant_subquery()
+            if subquery:
+                leaves.append(('id', 'inselect', subquery))
+        return leaves
+
+    def _get_dependency_domain(self):
+        """Return the domain matching records of all master songs.
+
+        Records collected by each dependency are OR-ed.
+        Built when the domain gets evaluated, never stored.
+        """
+        domains = [[leaf] for leaf in self._get_dependant_subquery_leaves()]
+        listed = self._get_dependant_domain()
+        if listed:
+            domains.append(listed)
+        return expression.OR(domains) if domains else []
+
+    def _has_dependant_ids_domain(self):
+        """Tell if the domain only lists ids of master songs' records.
+
+        Dependant songs used to store such domains.
+        """
+        if not self.depends_on_ids or not self.domain:
+            return False
+        domain = safe_eval(self.domain)
+        return (
+            len(domain) == 1 and len(domain[0]) == 3 and
+            tuple(domain[0][:2]) == ('id', 'in')
+        )
+
+    @api.multi
+    def _refresh_dependant_domain(self):
+        """Reset stale domains of songs whose master songs have changed.
+
+        Done once per burn: an ids domain stored by dependant songs
+        would restrict the records master songs collect now.
+        """
+        for song in self:
+            vals = {}
+            if song.depends_domain_outdated:
+                vals['depends_domain_outdated'] = False
+            if song._has_dependant_ids_domain():
+                vals['domain'] = '[]'
+            if vals:
+                song.write(vals)
 
     @api.onchange('records_count')
     def onchange_records_count(self):
-        """Switch song type if needed."""
-        # TODO: decide if we want this or something similar
-        # if self.records_count > HEAVY_IMPORT_THRESHOLD:
-        #     self.song_type = 'load_csv_defer_parent'
-        # else:
-        #     self.song_type = 'load_csv'
-        pass
+        """Switch to heavy import if there are too many records."""
+        if self.song_type not in self._heavy_switchable_types:
+            return
+        threshold = self._get_heavy_import_param(
+            'threshold', HEAVY_IMPORT_THRESHOLD)
+        song_type = 'load_csv'
+        if threshold and self.records_count > threshold:
+            song_type = 'load_csv_heavy'
+        if song_type != self.song_type:
+            self.song_type = song_type
+            self.onchange_song_type()
+
+    _heavy_switchable_types = ('load_csv', 'load_csv_heavy')
+
+    @api.multi
+    def _switch_heavy_import(self):
+        """Apply heavy import threshold to songs about to be burnt.
+
+        Records can be added or removed once the song is saved:
+        `onchange_records_count` is not enough.
+        """
+        for song in self.filtered(
+                lambda x: x.song_type in self._heavy_switchable_types):
+            song_type = song.song_type
+            song.onchange_records_count()
+            if song.song_type != song_type:
+                _logger.info(
+                    'Song %s switched to %s: %d records to export.',
+                    song.name, song.song_type, song.records_count)
+
+    def _get_heavy_import_param(self, key, default):
+        """Read heavy import settings from system parameters."""
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'base_dj.heavy_import_' + key)
+        return int(value) if value else default
 
     @api.multi
     def dj_template_vars(self):
@@ -267,6 +420,10 @@ class Song(models.Model):
     @api.model
     def eval_domain(self):
         domain = safe_eval(self.domain) if self.domain else []
+        dependency_domain = self._get_dependency_domain()
+        if dependency_domain:
+            # song's own domain filters master songs' records
+            domain = expression.AND([domain, dependency_domain])
         ids_blacklist = self._dj_global_config('record_blacklist') or []
         if ids_blacklist:
             domain.append(('id', 'not in', ids_blacklist))
@@ -340,28 +497,58 @@ class Song(models.Model):
         """Final csv path into zip file."""
         return self._real_path(self.csv_path)
 
+    def real_second_pass_csv_path(self):
+        """Final path of the csv to load in a 2nd pass."""
+        path, ext = os.path.splitext(self.real_csv_path())
+        return path + '.second_pass' + ext
+
     def real_binaries_path(self):
         """Final path for binary files."""
         return self._real_path(self.binaries_path)
 
     @api.multi
-    def burn_track(self):
-        """Search items and burn the track for the compilations."""
+    def burn_track(self, items=None):
+        """Search items and burn the track for the compilations.
+
+        :param items: records to export, searched if not passed.
+        """
         self.ensure_one()
+        self._refresh_dependant_domain()
         # pass around corect xmlid module name based on compilation
         song_self = self.with_context(
             dj_xmlid_module=self.compilation_id.xmlid_module_name)
-        path = data = None
-        if not self.only_config and not self.scratchable():
-            path, data = song_self.make_csv()
+        if items:
+            items = song_self.song_model.browse(items.ids)
+        tracks = []
         if self.scratchable():
-            path, data = song_self.scratch_it()
-        if path and data:
-            res = [(path, data), ]
-            if not self.scratchable():
-                res.extend(song_self._handle_special_fields())
-            return res
-        return None
+            tracks.append(song_self.scratch_it())
+        elif not self.only_config:
+            tracks.extend(song_self._make_csv_tracks(items=items))
+        res = [(path, data) for path, data in tracks if path and data]
+        if not res:
+            return None
+        if not self.scratchable():
+            res.extend(song_self._handle_special_fields(items=items))
+        return res
+
+    @api.multi
+    def burn_translations_tracks(self, translations):
+        """Burn tracks for translations' shadow songs of current song.
+
+        Records are searched only once and shared by all the languages.
+        Their xmlids are already there as they get generated
+        when the current song is burnt, hence every lang reuses them.
+
+        :param translations: shadow songs, one per lang.
+        """
+        self.ensure_one()
+        tracks = []
+        if self.only_config or self.scratchable():
+            return tracks
+        items = self._get_exportable_records()
+        for song in translations:
+            tracks.extend(song.burn_track(items=items) or [])
+        return tracks
 
     def scratchable(self):
         """Tell you if the song is scratchable.
@@ -377,9 +564,8 @@ class Song(models.Model):
         return getattr(self, self.song_type)()
 
     def _get_dependant_songs(self):
-        self.ensure_one()
         return self.env['dj.song.dependency'].search([
-            ('master_song_id', '=', self.id)
+            ('master_song_id', 'in', self.ids)
         ]).mapped('song_id')
 
     def _handle_fields_shortcuts(self, vals):
@@ -404,26 +590,82 @@ class Song(models.Model):
                 ids.extend(fields.ids)
                 vals[fname] = [(6, 0, ids)]
 
+    # changing these fields changes the records collected by dependant songs
+    _dj_dependency_trigger_fields = ('domain', 'python_code', 'model_id')
+
     @api.multi
     def write(self, vals):
         self._handle_fields_shortcuts(vals)
-        for item in self:
-            # update dependant songs
-            for dep in item._get_dependant_songs():
-                dep.onchange_depends_on_ids()
-        return super(Song, self).write(vals)
+        res = super(Song, self).write(vals)
+        if any(fname in vals for fname in self._dj_dependency_trigger_fields):
+            # stale ids domains of dependant songs are reset on next burn.
+            # See `_refresh_dependant_domain`.
+            self._get_dependant_songs().write({
+                'depends_domain_outdated': True,
+            })
+        return res
+
+    def _must_defer_onchanges(self):
+        ctx = self.env.context
+        return ctx.get('dj_defer_onchanges') or (
+            ctx.get('install_mode') and not testing)
 
     @api.model
     def create(self, vals):
         self._handle_fields_shortcuts(vals)
+        if self._must_defer_onchanges():
+            # onchanges are played in one pass once module's data is loaded
+            # and they must not override the values we got here.
+            # See `play_pending_onchanges`.
+            vals['onchanges_keep_fields'] = ','.join(sorted(vals))
+            vals['onchanges_pending'] = True
         item = super(Song, self).create(vals)
-        if self.env.context.get('install_mode') or testing:
+        if (self.env.context.get('install_mode') or testing) and \
+                not item.onchanges_pending:
             # if we are installing/updating the module
             # let's play all onchanges to make sure
             # defaults, filters, etc are set properly on each song
-            item.play_onchanges()
+            # w/o overriding the values we got here
+            item.play_all_onchanges(keep_fields={item.id: list(vals)})
         return item
 
+    @api.multi
+    def play_all_onchanges(self, inplace=True, keep_fields=None):
+        pending = self.filtered('onchanges_pending')
+        if keep_fields is None:
+            keep_fields = {
+                song.id: string_to_list(song.onchanges_keep_fields)
+                for song in pending
+            }
+        res = super(Song, self).play_all_onchanges(
+            inplace=inplace, keep_fields=keep_fields)
+        if inplace and pending:
+            pending.write({
+                'onchanges_pending': False,
+                'onchanges_keep_fields': False,
+            })
+        return res
+
+    @api.model
+    def play_pending_onchanges(self):
+        """Play all deferred onchanges in one pass."""
+        self.with_context(active_test=False).search([
+            ('onchanges_pending', '=', True),
+        ]).play_all_onchanges()
+
+    def _register_hook(self):
+        """Play onchanges deferred while installing/updating modules.
+
+        Done once all modules' data is loaded.
+        Songs still pending (eg: modules installed from the UI)
+        get their onchanges played at burn:
+        see `dj.compilation.play_songs_onchanges`.
+        """
+        res = super(Song, self)._register_hook()
+        if tools.config.get('init') or tools.config.get('update'):
+            self.play_pending_onchanges()
+        return res
+
     def _get_fields(self, model_id, field_list):
         """Helper to retrieve fields records from a name list."""
         model_name = self.env['ir.model'].browse(model_id).name
@@ -501,6 +743,23 @@ class Song(models.Model):
             field_names.insert(1, 'name')
         return [to_str(x) for x in field_names]
 
+    def _get_csv_relations(self):
+        """Map song's CSV relational columns to their comodels."""
+        if self.song_model is None or not self.has_records:
+            return {}
+        model_fields = self.song_model._fields
+        return {
+            x: model_fields[x[:-3]].comodel_name
+            for x in self.get_csv_field_names()
+            if x.endswith('/id') and x[:-3] in model_fields
+        }
+
+    def _get_related_models(self):
+        """Return models referenced by song's CSV relational columns."""
+        return set(
+            self._get_csv_relations().values()
+        ).difference([self.model_name])
+
     def get_csv_field_names_exclude(self):
         """Return fields that must be imported in 2 steps.
 
@@ -518,19 +777,19 @@ class Song(models.Model):
             field = info[fname]
             if field.get('relation') == self.song_model._name:
                 exclude.append(fname + '/id')
-        return [x for x in exclude if x in self.get_csv_field_names()]
+        if self.compilation_id.auto_order:
+            # relations to models loaded later
+            cyclic = self.compilation_id._get_models_graph()[1]
+            exclude.extend(cyclic.get(self.model_name, ()))
+        return [x for x in self.get_csv_field_names() if x in exclude]
 
-    @tools.ormcache_context('self', 'key', keys=('dj_xmlid_force'))
     def _dj_global_config(self, key=None):
         """Retrieve default global config for song model."""
         model = self.model_name
         if self.env.context.get('dj_xmlid_force'):
             # we are exporting the dj.song itself
             model = self._name
-        config = self.env['dj.equalizer'].search([
-            ('model', '=', model),
-        ], limit=1)
-        return config.get_conf(key)
+        return self.env['dj.equalizer'].get_model_conf(model, key=key)
 
     def _get_xmlid_fields(self, include_global=False):
         """Retrieve fields to generate xmlids."""
@@ -556,6 +815,51 @@ class Song(models.Model):
             xmlid_fields_map[song.model_name] = song._get_xmlid_fields()
         return xmlid_fields_map
 
+    def _has_python_code(self):
+        """Tell if python code does something besides default comments."""
+        return any(
+            line.strip() and not line.strip().startswith('#')
+            for line in (self.python_code or '').splitlines()
+        )
+
+    def _has_exportable_records(self):
+        if self.song_model is None:
+            return False
+        if self.song_model.search(self.eval_domain(), limit=1):
+            return True
+        return bool(self._has_python_code() and self.eval_python_code())
+
+    def _is_pruned(self):
+        """Dependant songs are useless if master songs have no records."""
+        masters = self.depends_on_ids.mapped('master_song_id')
+        return bool(masters) and not any(
+            master._has_exportable_records() for master in masters)
+
+    @api.multi
+    def _sorted_by_dependencies(self, extra_dependencies=None):
+        """Sort songs so that master songs come before their dependants.
+
+        Songs whose master songs have no record to export are dropped.
+
+        :param extra_dependencies: dictionary `song id -> songs ids`
+            of other songs to play before.
+        """
+        songs = self.filtered(lambda x: not x._is_pruned())
+        extra_dependencies = extra_dependencies or {}
+        dependencies = {
+            song.id: song.depends_on_ids.mapped('master_song_id').ids +
+            list(extra_dependencies.get(song.id, []))
+            for song in songs
+        }
+        try:
+            ordered_ids = toposort(songs.ids, dependencies)
+        except DependencyCycleError as err:
+            raise exceptions.UserError(
+                _('Circular dependency between songs: %s') % ', '.join(
+                    self.browse(err.nodes).mapped('name'))
+            )
+        return self.browse(ordered_ids)
+
     def _get_exportable_records(self, order=None):
         if self.song_model is None:
             return []
@@ -602,32 +906,111 @@ class Song(models.Model):
             **self._dj_export_context()
         )
         special = song_model._dj_special_fields()
+        if not special:
+            return extra_tracks
+        if self.export_lang:
+            items = items.with_context(lang=self.export_lang)
         for fname, info in special:
-            for rec in items:
-                if self.export_lang:
-                    rec = rec.with_context(lang=self.export_lang)
-                content = rec[fname]
-                if not content:
-                    continue
-                path = song_model._dj_file_to_path(rec, fname, bare_path=True)
+            with_value = items.filtered(fname)
+            # compute paths (and xmlids) for all the records at once
+            paths = song_model.browse(with_value.ids)._dj_files_to_paths(
+                fname, info=info, bare_path=True)
+            for rec in with_value:
                 fs_content = self.song_model._dj_file_content_to_fs(
                     fname, rec, info=info)
-                extra_tracks.append((path, fs_content))
+                extra_tracks.append((paths[rec.id], fs_content))
         return extra_tracks
 
-    def make_csv(self, items=None):
+    def _make_csv_tracks(self, items=None):
+        if self.song_type == 'load_csv_copy':
+            # model or fields might have changed since song creation
+            self._check_copy_safe()
+        second_pass = self._has_second_pass()
+        if second_pass:
+            # search only once for both passes
+            items = items or self._get_exportable_records()
+        if self._get_csv_chunk_size():
+            tracks = self.make_csv_chunks(items=items)
+        else:
+            tracks = [self.make_csv(items=items), ]
+        if second_pass:
+            tracks.append(self.make_second_pass_csv(items=items))
+        return tracks
+
+    def _has_second_pass(self):
+        # COPY songs resolve relations between their own rows
+        return (self.song_type != 'load_csv_copy' and
+                bool(self.get_csv_field_names_exclude()))
+
+    # song types whose templates load CSV chunks
+    _chunkable_types = ('load_csv', 'load_csv_heavy', 'load_csv_copy')
+
+    def _get_csv_chunk_size(self):
+        if self.song_type not in self._chunkable_types:
+            return 0
+        if self.chunk_size or self.song_type != 'load_csv_heavy':
+            return self.chunk_size
+        return self._get_heavy_import_param(
+            'chunk_size', HEAVY_IMPORT_CHUNK_SIZE)
+
+    def real_csv_chunk_paths(self, count=None):
+        """Final csv paths into zip file, one per chunk of records."""
+        chunk_size = self._get_csv_chunk_size()
+        if not chunk_size:
+            return [self.real_csv_path(), ]
+        if count is None:
+            count = len(self._get_exportable_records())
+        chunks = max(1, -(-count // chunk_size))
+        path, ext = os.path.splitext(self.real_csv_path())
+        return ['{}_{:03d}{}'.format(path, i, ext)
+                for i in range(1, chunks + 1)]
+
+    def make_csv_chunks(self, items=None):
+        """Create one csv per chunk of records.
+
+        :return: list of tuples `(path, content)`
+        """
+        items = items or self._get_exportable_records()
+        chunk_size = self._get_csv_chunk_size()
+        paths = self.real_csv_chunk_paths(count=len(items))
+        return [
+            self.make_csv(
+                items=items[i * chunk_size:(i + 1) * chunk_size], path=path)
+            for i, path in enumerate(paths)
+        ]
+
+    def _export_data(self, items, field_names):
+        """Export rows of `items` values for given CSV columns."""
+        records = items.with_context(**self._dj_export_context())
+        if self.sql_export:
+            return sql_export_rows(records, field_names)
+        return export_rows(records, field_names)
+
+    def make_csv(self, items=None, path=None):
         """Create the csv and return path and content."""
         items = items or self._get_exportable_records()
         field_names = self.get_csv_field_names()
-        export_data = items.with_context(
-            **self._dj_export_context()
-        ).export_data(field_names).get('datas', [])
+        export_data = self._export_data(items, field_names)
         csv_data = csv_from_data(field_names, export_data)
         # get bytes, convert to string, cleanup, convert back to bytes
         csv_data = str(
             csv_data, 'utf-8'
         ).replace('\r\n', '\n').replace('^M', '\n')
-        return (self.real_csv_path(), csv_data.encode())
+        return (path or self.real_csv_path(), csv_data.encode())
+
+    def make_second_pass_csv(self, items=None):
+        """Create the csv holding the columns to load in a 2nd pass.
+
+        Only `id` and the columns from `get_csv_field_names_exclude`
+        for the rows where at least one of them is set.
+        """
+        items = items or self._get_exportable_records()
+        field_names = ['id'] + self.get_csv_field_names_exclude()
+        export_data = self._export_data(items, field_names)
+        csv_data = csv_from_data(
+            field_names, [row for row in export_data if any(row[1:])])
+        csv_data = str(csv_data, 'utf-8').replace('\r\n', '\n')
+        return (self.real_second_pass_csv_path(), csv_data.encode())
 
     def anthem_path(self):
         path = self.compilation_id.disc_full_path(
@@ -655,17 +1038,15 @@ class Song(models.Model):
 
         res = []
         model = self.song_model.with_context(dj_export=True)
+        fnames = [
+            fname for fname in model._dj_settings_fields_get()
+            if fname not in SPECIAL_FIELDS
+        ]
+        fields_info = model.fields_get(fnames)
         for company in companies:
-            with force_company(self.env, company.id):
-                fnames = model._dj_settings_fields_get()
-                wizard = model.create({})
-                values = wizard.read(
-                    fields=fnames, load='_classic_write')[0]
+            values = self._dj_settings_company_values(model, fnames, company)
             cp_values = {}
-            fields_info = model.fields_get(fnames)
             for fname, val in values.items():
-                if fname in SPECIAL_FIELDS:
-                    continue
                 finfo = fields_info[fname]
                 val = to_str(val, safe=True)
                 label, val = self._dj_settings_val(finfo, fname, val)
@@ -677,6 +1058,28 @@ class Song(models.Model):
             res.append((song_name, company.aka, cp_values))
         return res
 
+    def _dj_settings_company_values(self, model, fnames, company):
+        """Compute settings values for given company.
+
+        We do not create any settings record
+        nor switch user's company:
+        an in-memory record is enough to compute values,
+        company dependent fields are read via `force_company` ctx key
+        and settings w/ a `company_id` field get it by default,
+        so that fields related to the company follow it.
+        """
+        model = model.with_context(force_company=company.id)
+        names = list(fnames)
+        if 'company_id' in model._fields:
+            model = model.with_context(default_company_id=company.id)
+            names = list(set(names) | {'company_id'})
+        wizard = model.new(model.default_get(names))
+        return {
+            fname: wizard._fields[fname].convert_to_read(
+                wizard[fname], wizard, use_name_get=False)
+            for fname in fnames
+        }
+
     def _dj_settings_val(self, finfo, fname, val):
         """Format value to be exported."""
         # knowing which field does what is always difficult
@@ -710,11 +1113,10 @@ class Song(models.Model):
         grouped = defaultdict(list)
         core_addons = []
         for mod in addons:
-            mod_path = get_module_path(mod.name)
-            if not mod_path:
+            repo_name = get_module_repo(mod.name)
+            if not repo_name:
                 # be defensive w/ removed but not uninstalled modules
                 continue
-            repo_name = os.path.split(os.path.dirname(mod_path))[-1]
             if repo_name == 'addons':
                 # yeah, not 100% sure but for us work like that ;)
                 core_addons.append(mod)
@@ -775,16 +1177,94 @@ class SongDependency(models.Model):
                 ]
             }}
 
-    def _get_dependant_record_ids(self):
-        master_records = self.master_song_id._get_exportable_records()
+    # changing these fields changes the records collected by the song
+    _dj_dependency_trigger_fields = (
+        'song_id', 'master_song_id', 'model_field_id', 'model_field',
+    )
+
+    @api.model
+    def create(self, vals):
+        item = super(SongDependency, self).create(vals)
+        item.mapped('song_id').write({'depends_domain_outdated': True})
+        return item
+
+    @api.multi
+    def write(self, vals):
+        songs = self.mapped('song_id')
+        res = super(SongDependency, self).write(vals)
+        if any(fname in vals for fname in self._dj_dependency_trigger_fields):
+            songs |= self.mapped('song_id')
+            songs.write({'depends_domain_outdated': True})
+        return res
+
+    @api.multi
+    def unlink(self):
+        songs = self.mapped('song_id')
+        res = super(SongDependency, self).unlink()
+        songs.exists().write({'depends_domain_outdated': True})
+        return res
+
+    def _get_relation_field_name(self):
         if self.model_field_id:
-            fname = self.model_field_id.name
+            return self.model_field_id.name
         elif self.model_field:
-            fname = self.model_field
+            return self.model_field
+        raise exceptions.UserError(_(
+            'Provide either a field name (dotted path supported) '
+            'or a link to relation field.'
+        ))
+
+    def _dependant_cache_key(self):
+        return (self.master_song_id.id, self._get_relation_field_name())
+
+    def _get_subquery_field(self):
+        """Return master model's relation field if it supports subqueries.
+
+        Supported only for stored relation fields
+        and for master songs that do not rely on python code.
+        """
+        master = self.master_song_id
+        model = master.song_model
+        if model is None or master._has_python_code():
+            return None
+        field = model._fields.get(self._get_relation_field_name())
+        if (not field or not field.store or
+                field.type not in ('many2one', 'many2many')):
+            return None
+        return field
+
+    def _get_dependant_subquery(self):
+        """Return SQL query and params selecting master records' relations.
+
+        See `_get_subquery_field`.
+        """
+        field = self._get_subquery_field()
+        if not field:
+            return None
+        master = self.master_song_id
+        model = master.song_model
+        fname = field.name
+        query = model._where_calc(master.eval_domain())
+        model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, params = query.get_sql()
+        where_clause = ' WHERE %s' % where_clause if where_clause else ''
+        if field.type == 'many2one':
+            sql = 'SELECT "{}"."{}" FROM {}{}'.format(
+                model._table, fname, from_clause, where_clause)
         else:
-            raise exceptions.UserError(_(
-                'Provide either a field name (dotted path supported) '
-                'or a link to relation field.'
-            ))
+            sql = (
+                'SELECT "{rel}"."{col2}" FROM "{rel}" '
+                'WHERE "{rel}"."{col1}" IN '
+                '(SELECT "{table}".id FROM {from_clause}{where_clause})'
+            ).format(
+                rel=field.relation, col1=field.column1, col2=field.column2,
+                table=model._table, from_clause=from_clause,
+                where_clause=where_clause,
+            )
+        return sql, list(params)
+
+    def _get_dependant_record_ids(self):
+        fname = self._get_relation_field_name()
+        master_records = self.master_song_id._get_exportable_records()
         records = master_records.mapped(fname)
         return records.ids
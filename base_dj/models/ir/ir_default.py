@@ -7,14 +7,19 @@ from ...utils import (
     xmlid_to_property,
     ODOOVER,
     string_to_list,
+    prefetch_xmlids,
+    xmlids_to_ids,
 )
 from odoo.tools import pickle
+from collections import defaultdict
 import json
 
 
 class DefaultMixin(models.AbstractModel):
     _name = 'default.mixin'
     _value_key = 'value'
+    # fields needed to convert values to xmlids on read
+    _value_deps = ()
 
     @api.model
     def create(self, vals):
@@ -26,6 +31,17 @@ class DefaultMixin(models.AbstractModel):
         self._dj_xmlid_to_values(vals)
         return super(DefaultMixin, self).write(vals)
 
+    @api.model
+    def load(self, fields, data):
+        """Resolve xmlid values of all the rows w/ one query."""
+        model = self
+        if (self.env.context.get('xmlid_value_reference') and
+                self._value_key in fields):
+            pos = fields.index(self._value_key)
+            mapping = prefetch_xmlids(self.env, [row[pos] for row in data])
+            model = self.with_context(dj_xmlids_map=mapping)
+        return super(DefaultMixin, model).load(fields, data)
+
     def _dj_xmlid_to_values(self, vals):
         """Convert xmlid to db values."""
         raise NotImplementedError()
@@ -34,15 +50,28 @@ class DefaultMixin(models.AbstractModel):
         """Return field info if values match a related field."""
         raise NotImplementedError()
 
+    def _dj_sql_export_columns(self, columns):
+        res = super(DefaultMixin, self)._dj_sql_export_columns(columns)
+        # converted to xmlids on read
+        return [x for x in res if x != self._value_key]
+
     @api.multi
     def read(self, fields=None, load='_classic_read'):
         """Convert values to xmlid."""
-        res = super(DefaultMixin, self).read(fields=fields, load=load)
         if not self.env.context.get('xmlid_value_reference'):
-            return res
+            return super(DefaultMixin, self).read(fields=fields, load=load)
+        extra = []
+        if fields and self._value_key in fields:
+            extra = [x for x in self._value_deps if x not in fields]
+            fields = list(fields) + extra
+        res = super(DefaultMixin, self).read(fields=fields, load=load)
         # wipe cache otherwise we gonna get the std value in any case
-        self.invalidate_cache([self._value_key])
+        self.invalidate_cache([self._value_key], self.ids)
         self._dj_values_to_xmlid(res)
+        for rec in res:
+            # not requested by the caller
+            for fname in extra:
+                rec.pop(fname, None)
         return res
 
     def _dj_values_to_xmlid(self, records):
@@ -67,6 +96,7 @@ if ODOOVER >= 11.0:
             'default.mixin',
         ]
         _value_key = 'json_value'
+        _value_deps = ('field_id', )
 
         def _dj_get_relation_field(self, field_id):
             """Return field info if values match a related field."""
@@ -85,24 +115,84 @@ if ODOOVER >= 11.0:
                 # TODO: `vals[self._value_key] == '[]'` means we are exporting
                 # an empty json list. We should avoid that.
                 if field and not vals[self._value_key] == '[]':
-                    values = string_to_list(
-                        vals[self._value_key],
-                        modifier=lambda x: self.env.ref(x).id)
+                    xmlids = string_to_list(vals[self._value_key])
+                    # resolve all of them at once
+                    mapping = xmlids_to_ids(self.env, xmlids)
+                    values = [mapping[x][1] for x in xmlids]
                     if field.ttype == 'many2one':
                         values = values[0]
                     vals[self._value_key] = json.dumps(values)
 
         def _dj_value_to_xmlid(self, field, rec):
-            value = rec[self._value_key]
-            rec_ids = json.loads(value)
-            model = self.env[field['relation']]
-            if rec_ids:
-                if isinstance(rec_ids, list):
-                    value = ','.join([model.browse(rec_id)._dj_export_xmlid()
-                                      for rec_id in rec_ids])
-                else:
-                    value = model.browse(rec_ids)._dj_export_xmlid()
+            xids = self._dj_values_xmlids(
+                [(field, json.loads(rec[self._value_key]))])
+            return self._dj_format_xmlid_value(
+                rec[self._value_key], field, xids)
+
+        def _dj_values_to_xmlid(self, records):
+            """Convert values to xmlids for all the records at once.
+
+            Fields are loaded in one go and referenced records' xmlids
+            are resolved w/ one query per related model.
+            """
+            records = [rec for rec in records if rec.get(self._value_key)]
+            if not records:
+                return
+            field_ids = {
+                self._dj_field_id(rec['field_id']) for rec in records
+                if rec.get('field_id')
+            }
+            fields_by_id = {
+                x.id: x for x in self.env['ir.model.fields'].browse(
+                    list(field_ids))
+                if x.ttype in ('many2one', 'many2many')
+            }
+            to_convert = []
+            for rec in records:
+                field = fields_by_id.get(
+                    self._dj_field_id(rec.get('field_id')))
+                if field:
+                    to_convert.append(
+                        (rec, field, json.loads(rec[self._value_key])))
+            xids = self._dj_values_xmlids(
+                [(field, value) for __, field, value in to_convert])
+            for rec, field, __ in to_convert:
+                rec[self._value_key] = self._dj_format_xmlid_value(
+                    rec[self._value_key], field, xids)
+
+        @staticmethod
+        def _dj_field_id(value):
+            # we get `(id, name)` w/ `_classic_read`
+            if isinstance(value, (list, tuple)):
+                return value[0]
             return value
+
+        def _dj_values_xmlids(self, fields_values):
+            """Retrieve xmlids for a list of `(field, json value)`.
+
+            :return: dictionary `{(model name, id): xmlid}`
+            """
+            ids_by_model = defaultdict(set)
+            for field, value in fields_values:
+                if not value:
+                    continue
+                ids = value if isinstance(value, list) else [value]
+                ids_by_model[field.relation].update(ids)
+            xids = {}
+            for model_name, ids in ids_by_model.items():
+                records = self.env[model_name].browse(list(ids))
+                for rec_id, xid in records._dj_export_xmlids().items():
+                    xids[(model_name, rec_id)] = xid
+            return xids
+
+        def _dj_format_xmlid_value(self, value, field, xids):
+            rec_ids = json.loads(value)
+            if not rec_ids:
+                return value
+            if isinstance(rec_ids, list):
+                return ','.join(
+                    [xids[(field.relation, rec_id)] for rec_id in rec_ids])
+            return xids[(field.relation, rec_ids)]
 else:
     class IRValues(models.Model):
 
@@ -112,6 +202,7 @@ else:
             'default.mixin',
         ]
         _value_key = 'value'
+        _value_deps = ('key', 'model', 'name')
 
         def _dj_get_relation_field(self, vals):
             """Return field info if values match a related field."""
@@ -0,0 +1,16 @@
+# Copyright 2017 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from odoo import models, api
+from ...utils import invalidate_addons_index
+
+
+class IrModule(models.Model):
+
+    _inherit = 'ir.module.module'
+
+    @api.model
+    def update_list(self):
+        """Addons might have been added or moved: rebuild their index."""
+        invalidate_addons_index()
+        return super(IrModule, self).update_list()
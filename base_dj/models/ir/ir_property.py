@@ -2,7 +2,11 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 from odoo import models, api
-from ...utils import property_to_xmlid, xmlid_to_property
+from ...utils import (
+    properties_to_xmlids,
+    xmlids_to_properties,
+    prefetch_xmlids,
+)
 
 
 class Property(models.Model):
@@ -15,11 +19,38 @@ class Property(models.Model):
     def _update_values(self, values):
         """Inverse xmlid values to property values."""
         if self.env.context.get('xmlid_value_reference'):
+            to_convert = [
+                values[fname]
+                for fname in self._property_like_fields_to_update
+                if values.get(fname)
+            ]
+            mapping = xmlids_to_properties(self.env, to_convert)
             for fname in self._property_like_fields_to_update:
                 if values.get(fname):
-                    values[fname] = xmlid_to_property(self.env, values[fname])
+                    values[fname] = mapping[values[fname]]
         return super(Property, self)._update_values(values)
 
+    @api.model
+    def load(self, fields, data):
+        """Resolve xmlid values of all the rows w/ one query."""
+        model = self
+        positions = [
+            fields.index(fname)
+            for fname in self._property_like_fields_to_update
+            if fname in fields
+        ]
+        if self.env.context.get('xmlid_value_reference') and positions:
+            mapping = prefetch_xmlids(
+                self.env, [row[pos] for row in data for pos in positions])
+            model = self.with_context(dj_xmlids_map=mapping)
+        return super(Property, model).load(fields, data)
+
+    def _dj_sql_export_columns(self, columns):
+        res = super(Property, self)._dj_sql_export_columns(columns)
+        # converted to xmlids on read
+        return [x for x in res
+                if x not in self._property_like_fields_to_update]
+
     @api.multi
     def read(self, fields=None, load='_classic_read'):
         """Convert property values to xmlid."""
@@ -27,9 +58,16 @@ class Property(models.Model):
         if not self.env.context.get('xmlid_value_reference'):
             return res
         # wipe cache otherwise we gonna get the std value in any case
-        self.invalidate_cache(self._property_like_fields_to_update)
+        self.invalidate_cache(self._property_like_fields_to_update, self.ids)
+        # convert all the values at once
+        to_convert = set()
+        for rec in res:
+            for fname in self._property_like_fields_to_update:
+                if rec.get(fname):
+                    to_convert.add(rec[fname])
+        mapping = properties_to_xmlids(self.env, to_convert)
         for rec in res:
             for fname in self._property_like_fields_to_update:
                 if rec.get(fname):
-                    rec[fname] = property_to_xmlid(self.env, rec[fname])
+                    rec[fname] = mapping[rec[fname]]
         return res
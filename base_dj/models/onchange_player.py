@@ -7,14 +7,14 @@
 # and adapted to make it generic.
 # TODO: release into independent module in server-tools
 
-from odoo import models, api
+from odoo import models, api, tools
 
 
 class OnchangePlayer(models.AbstractModel):
     _name = 'onchange.player.mixin'
 
     def _play_new_values(self, values, onchange_values,
-                         override_existing=True):
+                         override_existing=True, keep_fields=()):
         """Prepare new values with onchaged ones.
 
         :param values: current record values
@@ -22,14 +22,31 @@ class OnchangePlayer(models.AbstractModel):
         :param override_existing: override existing values or not.
             When true values already contained in `values` will be overridden.
             When false any value already in `values` won't be overriden.
+        :param keep_fields: fields never overridden.
         """
         vals = onchange_values.get('value', {})
         new_values = {}
         for fieldname, value in vals.items():
+            if fieldname in keep_fields:
+                continue
             if fieldname not in values or override_existing:
                 new_values[fieldname] = value
         return new_values
 
+    @tools.ormcache('model_name')
+    def _onchange_player_spec(self, model_name):
+        """Return onchange spec, onchange fields and all fields of a model.
+
+        Computed once per registry: they depend only on model's definition.
+        """
+        model = self.env[model_name]
+        onchange_specs = model._onchange_spec()
+        onchange_fields = tuple(
+            fname for fname, has_onchange in onchange_specs.items()
+            if has_onchange
+        )
+        return onchange_specs, onchange_fields, tuple(model._fields)
+
     def _play_onchanges(self, record, model=None,
                         onchange_fields=None, override_existing=True):
         """Play the onchanges on given record.
@@ -48,40 +65,49 @@ class OnchangePlayer(models.AbstractModel):
         ), 'You must pass a browse record or dict and a model.'
         if isinstance(record, models.BaseModel):
             values = record.copy_data()[0]
-            model = self.env[record._name]
+            model = record._name
         else:
             values = record
-            model = self.env[model]
-        onchange_specs = model._onchange_spec()
-        if not onchange_fields:
-            onchange_fields = []
-            for fname, has_onchange in onchange_specs.items():
-                if has_onchange:
-                    onchange_fields.append(fname)
-
-        # we need all fields in the dict even the empty ones
-        # otherwise 'onchange()' will not apply changes to them
-        all_values = values.copy()
-        for field in list(model.fields_get().keys()):
-            if field not in all_values:
-                all_values[field] = False
-
-        # we work on a temporary record
-        new_record = model.new(all_values)
+        return self._play_onchanges_values(
+            model, [values], onchange_fields=onchange_fields,
+            override_existing=override_existing)[0]
 
-        new_values = {}
-        for field in onchange_fields:
-            onchange_values = new_record.onchange(all_values,
-                                                  field, onchange_specs)
-            new_values.update(
-                self._play_new_values(
+    def _play_onchanges_values(self, model_name, values_list,
+                               onchange_fields=None, override_existing=True,
+                               keep_fields_list=None):
+        """Play the onchanges on a list of record values in one pass.
+
+        Model's onchange spec and fields are retrieved only once
+        and `onchange` is called once per record for all the fields:
+        the ORM cascades the onchanges triggered by changed values.
+
+        :param keep_fields_list: fields never overridden,
+            one list per item in `values_list`.
+        :return: a list of changed values, one per item in `values_list`.
+        """
+        model = self.env[model_name]
+        onchange_specs, all_onchange_fields, all_fields = \
+            self._onchange_player_spec(model_name)
+        onchange_fields = list(onchange_fields or all_onchange_fields)
+        keep_fields_list = keep_fields_list or [()] * len(values_list)
+        res = []
+        for values, keep_fields in zip(values_list, keep_fields_list):
+            # we need all fields in the dict even the empty ones
+            # otherwise 'onchange()' will not apply changes to them
+            all_values = dict.fromkeys(all_fields, False)
+            all_values.update(values)
+            new_values = {}
+            if onchange_fields:
+                onchange_values = model.onchange(
+                    all_values, onchange_fields, onchange_specs)
+                new_values = self._play_new_values(
                     values, onchange_values,
-                    override_existing=override_existing)
-            )
-            all_values.update(new_values)
+                    override_existing=override_existing,
+                    keep_fields=keep_fields)
+                all_values.update(new_values)
 
-        res = {f: v for f, v in all_values.items()
-               if f in values or f in new_values}
+            res.append({f: v for f, v in all_values.items()
+                        if f in values or f in new_values})
         return res
 
     @api.multi
@@ -91,9 +117,28 @@ class OnchangePlayer(models.AbstractModel):
         :param inplace: modify record on the fly.
         """
         self.ensure_one()
-        changed_values = self._play_onchanges(
-            self,
-            onchange_fields=self.env.context.get('onchange_fields', []))
-        if inplace:
-            self.write(changed_values)
-        return changed_values
+        return self.play_all_onchanges(inplace=inplace)[self.id]
+
+    @api.multi
+    def play_all_onchanges(self, inplace=True, keep_fields=None):
+        """Play the onchanges on all the records in one pass.
+
+        :param inplace: modify records on the fly.
+        :param keep_fields: dictionary of fields never overridden
+            by record id.
+        :return: a dictionary of changed values by record id.
+        """
+        if not self:
+            return {}
+        keep_fields = keep_fields or {}
+        values_list = [record.copy_data()[0] for record in self]
+        changed = self._play_onchanges_values(
+            self._name, values_list,
+            onchange_fields=self.env.context.get('onchange_fields', []),
+            keep_fields_list=[keep_fields.get(x.id, ()) for x in self])
+        res = {}
+        for record, changed_values in zip(self, changed):
+            if inplace:
+                record.write(changed_values)
+            res[record.id] = changed_values
+        return res
@@ -0,0 +1,128 @@
+# Copyright 2017 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+"""Deferred parent store computation for generated songs.
+
+Odoo's `_parent_store_compute` runs one UPDATE per record.
+Here we read the whole tree w/ one query, compute the nested sets
+in memory and write them back w/ one UPDATE per page of values.
+
+Generated songs use it like:
+
+    from odoo.addons.base_dj.parent_store import compute_parents
+
+    compute_parents(ctx.env, ['res.partner', 'product.category'])
+"""
+
+from psycopg2.extras import execute_values
+
+# rows updated per statement
+UPDATE_PAGE_SIZE = 10000
+
+
+def nested_set_bounds(roots, children):
+    """Compute `parent_left` and `parent_right` values.
+
+    Numbering is the same as odoo's `_parent_store_compute`.
+
+    :param roots: ordered list of ids w/out parent
+    :param children: dictionary `id -> ordered list of children ids`
+    :return: dictionary `id -> (parent_left, parent_right)`
+    """
+    bounds = {}
+    pos = 0
+    for root in roots:
+        # frames: [node, left, next position, children iterator]
+        stack = [[root, pos, pos + 1, iter(children.get(root, ()))]]
+        while stack:
+            frame = stack[-1]
+            child = next(frame[3], None)
+            if child is not None:
+                if child in bounds:
+                    raise ValueError('Recursion detected on id %s' % child)
+                stack.append([
+                    child, frame[2], frame[2] + 1,
+                    iter(children.get(child, ()))])
+                continue
+            node, left, right, __ = stack.pop()
+            bounds[node] = (left, right)
+            if stack:
+                stack[-1][2] = right + 1
+            else:
+                pos = right + 1
+    return bounds
+
+
+def parent_paths(roots, children):
+    """Compute `parent_path` values (like `1/5/12/`).
+
+    :return: dictionary `id -> parent_path`
+    """
+    paths = {}
+    stack = [(root, '') for root in reversed(roots)]
+    while stack:
+        node, prefix = stack.pop()
+        if node in paths:
+            raise ValueError('Recursion detected on id %s' % node)
+        paths[node] = '%s%d/' % (prefix, node)
+        stack.extend(
+            (child, paths[node]) for child in reversed(children.get(node, ()))
+        )
+    return paths
+
+
+def _read_tree(model):
+    cr = model.env.cr
+    query = 'SELECT id, "{}" FROM "{}"'.format(
+        model._parent_name, model._table)
+    if getattr(model, '_parent_order', None):
+        query += ' ORDER BY ' + model._parent_order
+    cr.execute(query)
+    roots = []
+    children = {}
+    for rec_id, parent_id in cr.fetchall():
+        if parent_id:
+            children.setdefault(parent_id, []).append(rec_id)
+        else:
+            roots.append(rec_id)
+    return roots, children
+
+
+def compute_parent_store(model):
+    """Compute parent store columns for the whole table of `model`."""
+    if not model._parent_store:
+        return
+    roots, children = _read_tree(model)
+    cr = model.env.cr
+    if 'parent_path' in model._fields and 'parent_left' not in model._fields:
+        fnames = ['parent_path']
+        values = [
+            (rec_id, path)
+            for rec_id, path in parent_paths(roots, children).items()
+        ]
+        query = (
+            'UPDATE "{0}" SET parent_path = v.path '
+            'FROM (VALUES %s) AS v(id, path) WHERE "{0}".id = v.id'
+        )
+    else:
+        fnames = ['parent_left', 'parent_right']
+        values = [
+            (rec_id, left, right)
+            for rec_id, (left, right)
+            in nested_set_bounds(roots, children).items()
+        ]
+        query = (
+            'UPDATE "{0}" SET parent_left = v.pleft, parent_right = v.pright '
+            'FROM (VALUES %s) AS v(id, pleft, pright) WHERE "{0}".id = v.id'
+        )
+    if values:
+        execute_values(
+            cr, query.format(model._table), values,
+            page_size=UPDATE_PAGE_SIZE)
+    model.invalidate_cache(fnames)
+
+
+def compute_parents(env, model_names):
+    """Compute parent store for all the given models."""
+    for model_name in model_names:
+        compute_parent_store(env[model_name])
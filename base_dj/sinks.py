@@ -0,0 +1,168 @@
+# Copyright 2017 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+"""Burn sinks: destinations for compilation tracks.
+
+A track is a tuple `(path, content)` as returned by `_get_tracks`.
+Sinks take care of writing them somewhere: a zip file, a tar stream
+or straight into a project checkout.
+"""
+
+import hashlib
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+
+def track_content_to_bytes(data):
+    """Tracks can hold text (songs, readme) or bytes (csv, binaries)."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return data
+
+
+class BurnSink(object):
+    """Base sink. Subclasses must implement `write`."""
+
+    def write(self, path, data):
+        raise NotImplementedError()
+
+    def close(self):
+        """Finalize the sink and return its result, if any."""
+        return None
+
+    def burn(self, tracks):
+        """Write all the tracks and close the sink."""
+        for path, data in tracks:
+            self.write(path, track_content_to_bytes(data))
+        return self.close()
+
+
+class ZipSink(BurnSink):
+    """Burn tracks into an in-memory zip file."""
+
+    def __init__(self, fileobj=None):
+        self.fileobj = fileobj or io.BytesIO()
+        self.zf = zipfile.ZipFile(self.fileobj, 'w', zipfile.ZIP_DEFLATED)
+
+    def write(self, path, data):
+        # use info to keep date and set permissions
+        info = zipfile.ZipInfo(path, date_time=time.localtime(time.time()))
+        # set proper permissions
+        info.external_attr = 0o644 << 16
+        self.zf.writestr(info, data)
+
+    def close(self):
+        self.zf.close()
+        self.fileobj.seek(0)
+        return self.fileobj
+
+
+class _ChunksBuffer(object):
+    """Write-only file object collecting data until it's popped."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class TarSink(BurnSink):
+    """Stream tracks into a gzipped tar.
+
+    The tar is written in stream mode (`w|gz`) hence `fileobj`
+    can be anything writable: a file, a socket, `sys.stdout.buffer`...
+    """
+
+    def __init__(self, fileobj=None):
+        self.fileobj = fileobj or io.BytesIO()
+        self.tf = tarfile.open(fileobj=self.fileobj, mode='w|gz')
+
+    def write(self, path, data):
+        info = tarfile.TarInfo(path)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self.tf.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tf.close()
+        if isinstance(self.fileobj, io.BytesIO):
+            self.fileobj.seek(0)
+        return self.fileobj
+
+    @classmethod
+    def iter_burn(cls, tracks):
+        """Yield gzipped tar data chunk by chunk while writing tracks.
+
+        Handy to stream the tar w/out holding the whole archive in memory.
+        """
+        buf = _ChunksBuffer()
+        sink = cls(fileobj=buf)
+        for path, data in tracks:
+            sink.write(path, track_content_to_bytes(data))
+            chunk = buf.pop()
+            if chunk:
+                yield chunk
+        sink.tf.close()
+        yield buf.pop()
+
+
+class DirectorySink(BurnSink):
+    """Write tracks straight into a directory (eg: a project checkout).
+
+    :param root: base directory, the one where you'd unpack the zip file.
+    :param only_changed: do not touch files whose content did not change.
+        Content is compared via hash against what's already on disk,
+        so that re-burning big compilations only rewrites modified files.
+    """
+
+    def __init__(self, root, only_changed=False):
+        self.root = os.path.abspath(root)
+        self.only_changed = only_changed
+        self.written = []
+        self.skipped = []
+
+    def _full_path(self, path):
+        full_path = os.path.normpath(os.path.join(self.root, path))
+        if not full_path.startswith(self.root + os.sep):
+            raise ValueError(
+                'Track path `%s` goes outside `%s`' % (path, self.root))
+        return full_path
+
+    @staticmethod
+    def _hash_file(full_path):
+        digest = hashlib.sha1()
+        with open(full_path, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(65536), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def is_unchanged(self, full_path, data):
+        if not os.path.isfile(full_path):
+            return False
+        if os.path.getsize(full_path) != len(data):
+            return False
+        return self._hash_file(full_path) == hashlib.sha1(data).hexdigest()
+
+    def write(self, path, data):
+        full_path = self._full_path(path)
+        if self.only_changed and self.is_unchanged(full_path, data):
+            self.skipped.append(path)
+            return
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as fd:
+            fd.write(data)
+        self.written.append(path)
@@ -0,0 +1,145 @@
+# Copyright 2017 Camptocamp SA
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+"""Export song records w/ plain SQL instead of the ORM.
+
+Meant for big and simple models where most columns are stored scalars:
+
+* scalar columns are read straight from the table
+* many2one columns are read from the table too,
+  many2many ones from their relation table
+* related records' xmlids are retrieved in bulk per model
+* any other column goes through `base_dj.exporter`
+
+Raw values go through the same converters used by `base_dj.exporter`
+hence the resulting CSV is the same.
+Models can tweak which columns qualify
+via `_dj_sql_export_columns` (see `models.base`).
+"""
+
+import itertools
+
+from .exporter import export_rows as orm_export_rows, get_converter
+
+SQL_EXPORT_TYPES = (
+    'char', 'text', 'selection', 'boolean', 'integer', 'float', 'monetary',
+    'date', 'datetime',
+)
+
+
+def export_rows(records, field_names):
+    """Same as `base_dj.exporter.export_rows`, faster."""
+    if not records:
+        return []
+    model = records.browse()
+    model.check_access_rights('read')
+    sql_columns = model._dj_sql_export_columns(field_names)
+    orm_columns = [
+        x for x in field_names if x != 'id' and x not in sql_columns
+    ]
+    values = _read_columns(records, sql_columns)
+    if 'id' in field_names:
+        values['id'] = records._dj_export_xmlids()
+    if orm_columns:
+        orm_rows = orm_export_rows(records, orm_columns)
+        for pos, column in enumerate(orm_columns):
+            values[column] = {
+                rec_id: row[pos] for rec_id, row in zip(records.ids, orm_rows)
+            }
+    return [
+        [values[column][rec_id] for column in field_names]
+        for rec_id in records.ids
+    ]
+
+
+def _read_columns(records, columns):
+    """Read CSV columns of `records` via SQL.
+
+    :return: dictionary `column -> {record id: exported value}`
+    """
+    model = records.browse()
+    fields_map = model._fields
+    scalars = [x for x in columns if not x.endswith('/id')]
+    many2one = [
+        x for x in columns
+        if x.endswith('/id') and fields_map[x[:-3]].type == 'many2one'
+    ]
+    many2many = [
+        x for x in columns if x.endswith('/id') and x not in many2one
+    ]
+    res = {}
+    names = scalars + [x[:-3] for x in many2one]
+    if names:
+        raw = _select(records, names)
+        for pos, column in enumerate(scalars):
+            field = fields_map[column]
+            converter = get_converter(field)
+            res[column] = {
+                rec_id: converter(
+                    field.convert_to_record(
+                        field.convert_to_cache(
+                            row[pos], model, validate=False),
+                        model),
+                    model)
+                for rec_id, row in raw.items()
+            }
+        for pos, column in enumerate(many2one, len(scalars)):
+            comodel = model.env[fields_map[column[:-3]].comodel_name]
+            related_ids = set(row[pos] for row in raw.values() if row[pos])
+            xmlids = comodel.browse(list(related_ids))._dj_export_xmlids()
+            res[column] = {
+                rec_id: xmlids[row[pos]] if row[pos] else False
+                for rec_id, row in raw.items()
+            }
+    for column in many2many:
+        res[column] = _read_many2many(records, fields_map[column[:-3]])
+    return res
+
+
+def _select(records, names):
+    cr = records.env.cr
+    query = 'SELECT id, {} FROM "{}" WHERE id IN %s'.format(
+        ', '.join('"%s"' % x for x in names), records._table)
+    res = {}
+    for sub_ids in cr.split_for_in_conditions(records.ids):
+        cr.execute(query, (sub_ids, ))
+        res.update((row[0], row[1:]) for row in cr.fetchall())
+    return res
+
+
+def _read_many2many(records, field):
+    """Export many2many xmlids.
+
+    Related records are filtered and sorted like the ORM reads them:
+    field's domain, field's context, record rules and comodel's order.
+    """
+    cr = records.env.cr
+    query = 'SELECT "{}", "{}" FROM "{}" WHERE "{}" IN %s'.format(
+        field.column1, field.column2, field.relation, field.column1)
+    related = {}
+    for sub_ids in cr.split_for_in_conditions(records.ids):
+        cr.execute(query, (sub_ids, ))
+        for rec_id, related_id in cr.fetchall():
+            related.setdefault(rec_id, set()).add(related_id)
+    # like the ORM, include archived records unless field's ctx says so
+    ctx = {'active_test': False}
+    ctx.update(field.context or {})
+    comodel = records.env[field.comodel_name].with_context(**ctx)
+    domain = field.domain
+    if callable(domain):
+        domain = domain(records.browse())
+    related_ids = set(itertools.chain.from_iterable(related.values()))
+    ordered = comodel.browse()
+    if related_ids:
+        ordered = comodel.search(
+            list(domain or []) + [('id', 'in', list(related_ids))])
+    xmlids = ordered._dj_export_xmlids()
+    position = {x: i for i, x in enumerate(ordered.ids)}
+    return {
+        rec_id: ','.join(
+            xmlids[x] for x in sorted(
+                related.get(rec_id, set()).intersection(position),
+                key=position.get)
+        ) or False
+        for rec_id in records.ids
+    }
@@ -38,6 +38,34 @@ class TestDefaults(models.Model, TestMixin):
     )
 
 
+class TestSettings(models.TransientModel, TestMixin):
+    _name = 'dj.test.settings'
+    _inherit = 'res.config.settings'
+
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        default=lambda self: self.env.user.company_id,
+    )
+    company_name = fields.Char(related='company_id.name')
+
+
+class TestTitleRelated(models.Model, TestMixin):
+    _name = 'dj.test.title.related'
+
+    title_id = fields.Many2one(comodel_name='res.partner.title')
+    title_shortcut = fields.Char(related='title_id.shortcut', store=True)
+
+
+class TestCopyPlain(models.Model, TestMixin):
+    _name = 'dj.test.copy.plain'
+
+    name = fields.Char()
+    sequence = fields.Integer(default=10)
+    amount = fields.Float()
+    flag = fields.Boolean()
+    partner_id = fields.Many2one(comodel_name='res.partner')
+
+
 class TestFileFields(models.Model, TestMixin):
     _name = 'dj.test.filefields'
     _test_setup_gen_xid = True
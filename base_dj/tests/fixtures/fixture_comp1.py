@@ -15,8 +15,9 @@ def load_res_company(ctx):
     model = ctx.env['res.company'].with_context(tracking_disable=True)
     header_exclude = ['parent_id/id']
     load_csv(ctx, model, path, header_exclude=header_exclude)
-    if header_exclude:
-        load_csv(ctx, model, path)
+    # load excluded columns now that all the records are there
+    path = 'install/generated/dj_test/comp1/res.company.second_pass.csv'
+    load_csv(ctx, model, path)
 
 
 @anthem.log
@@ -35,8 +36,9 @@ def load_res_partner(ctx):
     model = ctx.env['res.partner'].with_context(tracking_disable=True)
     header_exclude = ['commercial_partner_id/id', 'parent_id/id']
     load_csv(ctx, model, path, header_exclude=header_exclude)
-    if header_exclude:
-        load_csv(ctx, model, path)
+    # load excluded columns now that all the records are there
+    path = 'install/generated/dj_test/comp1/res.partner.second_pass.csv'
+    load_csv(ctx, model, path)
 
 
 @anthem.log
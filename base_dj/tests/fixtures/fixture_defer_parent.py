@@ -5,26 +5,27 @@
 # pylint: disable=C,E
 
 import anthem
-from ...common import (
-    deferred_import,
-    deferred_compute_parents
-)
+from anthem.lyrics.loaders import load_csv
+from odoo.addons.base_dj.parent_store import compute_parents
 
 
 @anthem.log
 def load_res_partner(ctx):
+    """ Import res.partner from csv w/out computing parents """
+    path = 'install/generated/dj_test/comp4/res.partner.csv'
     model = ctx.env['res.partner'].with_context(tracking_disable=True)
-    deferred_import(
-        ctx,
-        model,
-        'install/generated/dj_test/comp4/res.partner.csv',
-        defer_parent_computation=True)
+    model = model.with_context(defer_parent_store_computation=True)
+    header_exclude = ['commercial_partner_id/id', 'parent_id/id']
+    load_csv(ctx, model, path, header_exclude=header_exclude)
+    # load excluded columns now that all the records are there
+    path = 'install/generated/dj_test/comp4/res.partner.second_pass.csv'
+    load_csv(ctx, model, path)
 
 
 @anthem.log
 def load_res_partner_compute_parent(ctx):
     """Compute parent_left, parent_right"""
-    deferred_compute_parents(ctx, 'res.partner')
+    compute_parents(ctx.env, ['res.partner'])
 
 
 @anthem.log
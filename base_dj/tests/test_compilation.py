@@ -2,6 +2,13 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 from . common import BaseCompilationCase
+from ..parent_store import compute_parent_store
+import base64
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
 try:
     from unittest.mock import patch
 except ImportError:
@@ -52,6 +59,28 @@ class CompilationCase(BaseCompilationCase):
         expected_path = 'songs/install/generated/dj_test/comp4.py'
         self._burn_and_test(fixture, expected_path, 'base_dj.test_comp4')
 
+    def test_compute_parent_store(self):
+        model = self.env['res.partner.category'].with_context(
+            defer_parent_store_computation=True, active_test=False)
+        parent = model.create({'name': 'Parent'})
+        child = model.create({'name': 'Child', 'parent_id': parent.id})
+        model.create({'name': 'Grandchild', 'parent_id': child.id})
+        compute_parent_store(model)
+        categories = model.search([])
+        bounds = set()
+        for categ in categories:
+            self.assertLess(categ.parent_left, categ.parent_right)
+            bounds.update([categ.parent_left, categ.parent_right])
+            if categ.parent_id:
+                self.assertLess(categ.parent_id.parent_left, categ.parent_left)
+                self.assertGreater(
+                    categ.parent_id.parent_right, categ.parent_right)
+        # all bounds are unique
+        self.assertEqual(len(bounds), len(categories) * 2)
+        self.assertEqual(
+            sorted(model.search([('id', 'child_of', parent.id)]).ids),
+            sorted((parent | child | child.child_ids).ids))
+
     def test_burn_contents(self):
         fixture = 'fixture_comp1'
         self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
@@ -63,7 +92,9 @@ class CompilationCase(BaseCompilationCase):
         expected = sorted([
             'DEV_README.rst',
             'install/generated/dj_test/comp1/res.company.csv',
+            'install/generated/dj_test/comp1/res.company.second_pass.csv',
             'install/generated/dj_test/comp1/res.partner.csv',
+            'install/generated/dj_test/comp1/res.partner.second_pass.csv',
             'install/generated/dj_test/comp1/res.users.csv',
             'songs/install/__init__.py',
             'songs/install/generated/__init__.py',
@@ -93,7 +124,9 @@ class CompilationCase(BaseCompilationCase):
             'install/generated/dj_test/core1/ir.default.csv',
             'install/generated/dj_test/core1/res.lang.csv',
             'install/generated/dj_test/comp1/res.company.csv',
+            'install/generated/dj_test/comp1/res.company.second_pass.csv',
             'install/generated/dj_test/comp1/res.partner.csv',
+            'install/generated/dj_test/comp1/res.partner.second_pass.csv',
             'install/generated/dj_test/comp1/res.users.csv',
             'songs/install/__init__.py',
             'songs/install/generated/__init__.py',
@@ -102,3 +135,168 @@ class CompilationCase(BaseCompilationCase):
             'songs/install/generated/dj_test/core1.py',
         ])
         self.assertListEqual(paths, expected)
+
+    def test_burn_translations(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1')
+        self.env.ref('base_dj.test_song1').export_translations = True
+        to_patch = DJ_COMPILATION_MODEL_PATH + '._get_installed_langs'
+        with patch(to_patch) as mocked:
+            mocked.return_value = [
+                ('en_US', 'English'), ('fr_FR', 'French'), ('de_DE', 'German')
+            ]
+            playlist = comp._get_songs_playlist()
+            tracks = comp.with_context(
+                dj_read_skip_special_fields=True
+            ).get_all_tracks(include_core=False)
+        song, translations, others = playlist[0]
+        self.assertEqual(song, self.env.ref('base_dj.test_song1'))
+        self.assertEqual(
+            translations.mapped('export_lang'), ['fr_FR', 'de_DE'])
+        self.assertFalse(others)
+        paths = [x[0] for x in tracks]
+        base_path = 'install/generated/dj_test/comp1/'
+        for lang in ('fr_FR', 'de_DE'):
+            self.assertIn(base_path + 'res.company.%s.csv' % lang, paths)
+
+    def test_auto_order(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1')
+        company_song = self.env.ref('base_dj.test_song1')
+        users_song = self.env.ref('base_dj.test_song2')
+        partner_song = self.env.ref('base_dj.test_song3')
+        self.assertEqual(
+            partner_song.get_csv_field_names_exclude(),
+            ['commercial_partner_id/id', 'parent_id/id'])
+        comp.auto_order = True
+        # companies and users require partners
+        self.assertEqual(
+            comp._get_all_songs().mapped('model_name'),
+            ['res.partner', 'res.company', 'res.users'])
+        # partners point to companies and users loaded later
+        exclude = partner_song.get_csv_field_names_exclude()
+        self.assertIn('company_id/id', exclude)
+        self.assertIn('user_id/id', exclude)
+        self.assertIn('parent_id/id', exclude)
+        # required relations are never loaded later
+        self.assertNotIn(
+            'partner_id/id', company_song.get_csv_field_names_exclude())
+        self.assertNotIn(
+            'partner_id/id', users_song.get_csv_field_names_exclude())
+
+    def test_models_graph_once_per_burn(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1')
+        comp.auto_order = True
+        to_patch = DJ_COMPILATION_MODEL_PATH + '._compute_models_graph'
+        compute = type(comp)._compute_models_graph
+        with patch(to_patch, autospec=True, side_effect=compute) as mocked:
+            comp.with_context(
+                dj_read_skip_special_fields=True
+            ).get_all_tracks(include_core=False)
+        self.assertEqual(mocked.call_count, 1)
+
+    def test_playlist_once_per_burn(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1')
+        to_patch = DJ_COMPILATION_MODEL_PATH + '._get_songs_playlist'
+        playlist = type(comp)._get_songs_playlist
+        with patch(to_patch, autospec=True, side_effect=playlist) as mocked:
+            comp.with_context(
+                dj_read_skip_special_fields=True
+            ).get_all_tracks(include_core=False)
+        # disc is rendered w/ the songs of the same playlist
+        self.assertEqual(mocked.call_count, 1)
+
+    def test_parallel_stages(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1')
+        self.env['dj.song'].create({
+            'compilation_id': comp.id,
+            'model_id': self.env.ref('base.model_res_partner_title').id,
+            'sequence': 15,
+        })
+        self.assertNotIn('post_stages', comp.dj_template_vars())
+        comp.parallel_stages = True
+        values = comp.dj_template_vars()
+        # titles depend on nothing, users on companies,
+        # partners on companies, titles and users
+        self.assertEqual(values['post_stages'], [
+            ['load_res_company', 'load_res_partner_title'],
+            ['load_res_users'],
+            ['load_res_partner'],
+        ])
+        self.assertEqual(values['pre_stages'], [])
+        content = comp.with_context(
+            dj_read_skip_special_fields=True).burn_disc()[1]
+        self.assertIn('POST_STAGES = [', content)
+        self.assertNotIn('PRE_STAGES', content)
+
+    def test_burn_to_directory(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1').with_context(
+            dj_read_skip_special_fields=True, dj_exclude_core=True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sink = comp.burn_to_directory(tmpdir)
+            self.assertIn('songs/install/generated/dj_test/comp1.py',
+                          sink.written)
+            self.assertFalse(sink.skipped)
+            for path in sink.written:
+                self.assertTrue(os.path.isfile(os.path.join(tmpdir, path)))
+            # burn again: the disc did not change, it is not written again
+            sink = comp.burn_to_directory(tmpdir)
+            self.assertNotIn('songs/install/generated/dj_test/comp1.py',
+                             sink.written)
+            self.assertIn('songs/install/generated/dj_test/comp1.py',
+                          sink.skipped)
+
+    def test_burn_tar_stream(self):
+        fixture = 'fixture_comp1'
+        self._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
+        comp = self.env.ref('base_dj.test_comp1').with_context(
+            dj_read_skip_special_fields=True, dj_exclude_core=True)
+        filename, chunks = comp.burn_tar_stream()
+        self.assertTrue(filename.endswith('.tar.gz'))
+        data = b''.join(chunks)
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tf:
+            names = tf.getnames()
+        self.assertIn('songs/install/generated/dj_test/comp1.py', names)
+        self.assertIn(
+            'install/generated/dj_test/comp1/res.partner.csv', names)
+
+    def test_load_zip(self):
+        files = {
+            'dj.genre.csv': 'id,name\n__setup__.genre_zip,zip\n',
+            'dj.compilation.csv':
+                'id,name,genre_id/id\n'
+                '__setup__.comp_zip,comp zip,__setup__.genre_zip\n',
+            'dj.song.csv':
+                'id,compilation_id/id,model_id/id\n'
+                '__setup__.song_zip,__setup__.comp_zip,'
+                'base.model_res_partner\n',
+            'dj.song.dependency.csv': 'id,master_song_id/id,song_id/id\n',
+        }
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zf:
+            for filename, content in files.items():
+                zf.writestr(filename, content)
+        # base64 w/ new lines, decoded in chunks
+        data = base64.encodebytes(buf.getvalue())
+        with patch(
+                'odoo.addons.base_dj.wizards.load_compilation'
+                '.DECODE_CHUNK_SIZE', 10):
+            wiz = self.env['dj.load.compilation.wiz'].create({
+                'zip_file': data,
+            })
+            action = wiz.action_load()
+        comp = self.env['dj.compilation'].browse(action['res_id'])
+        self.assertEqual(comp, self.env.ref('__setup__.comp_zip'))
+        self.assertEqual(comp.genre_id.name, 'zip')
+        self.assertEqual(
+            comp.song_ids.mapped('model_id.model'), ['res.partner'])
@@ -3,7 +3,15 @@
 
 from . common import BaseCase
 from .fake_models import TestDefaults
+from ..utils import prefetch_xmlids
 import json
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+IR_DEFAULT_PATH = 'odoo.addons.base_dj.models.ir.ir_default'
+IR_PROPERTY_PATH = 'odoo.addons.base_dj.models.ir.ir_property'
 
 
 class DefaultsSongCase(BaseCase):
@@ -67,3 +75,96 @@ class DefaultsSongCase(BaseCase):
         expected = self.main_partner.id
         record.invalidate_cache()
         self.assertEqual(record.json_value, json.dumps(expected))
+
+    def test_bulk_xmlid_conversion(self):
+        """Verify that many values are converted at once both ways."""
+        default_model = self.env['ir.default']
+        categories = self.env['res.partner.category'].browse()
+        for name in ('dj1', 'dj2'):
+            category = self.env['res.partner.category'].create({
+                'name': name,
+            })
+            self.add_xmlid(category, 'base_dj.test_category_' + name)
+            categories |= category
+        default_model.set(
+            'res.partner', 'title',
+            self.env.ref('base.res_partner_title_madam').id)
+        default_model.set('res.partner', 'category_id', categories.ids)
+        records = (
+            self._get_default_record('dj.test.defaults', 'partner_id') |
+            self._get_default_record('res.partner', 'title') |
+            self._get_default_record('res.partner', 'category_id')
+        )
+        rows = records.with_context(
+            xmlid_value_reference=True).read(['json_value'])
+        self.assertEqual([x['json_value'] for x in rows], [
+            'base.main_partner',
+            'base.res_partner_title_madam',
+            'base_dj.test_category_dj1,base_dj.test_category_dj2',
+        ])
+        data = [
+            [str(records[0].id), 'base.partner_root'],
+            [str(records[1].id), 'base.res_partner_title_mister'],
+            [str(records[2].id),
+             'base_dj.test_category_dj2,base_dj.test_category_dj1'],
+        ]
+        with patch(IR_DEFAULT_PATH + '.prefetch_xmlids',
+                   wraps=prefetch_xmlids) as prefetch:
+            res = default_model.with_context(
+                xmlid_value_reference=True
+            ).load(['.id', 'json_value'], data)
+        # all the rows are resolved at once
+        self.assertEqual(prefetch.call_count, 1)
+        self.assertFalse(res['messages'])
+        records.invalidate_cache()
+        self.assertEqual(records.mapped('json_value'), [
+            json.dumps(self.env.ref('base.partner_root').id),
+            json.dumps(self.env.ref('base.res_partner_title_mister').id),
+            json.dumps(list(reversed(categories.ids))),
+        ])
+
+    def test_property_xmlid_round_trip(self):
+        """Verify that property values referencing records go both ways."""
+        field = self.env['ir.model.fields']._get('res.partner', 'title')
+        madam = self.env.ref('base.res_partner_title_madam')
+        mister = self.env.ref('base.res_partner_title_mister')
+        partners = self.main_partner | self.env.ref('base.partner_root')
+        prop_model = self.env['ir.property']
+        props = prop_model.browse()
+        for partner in partners:
+            props |= prop_model.create({
+                'name': 'title',
+                'fields_id': field.id,
+                'type': 'many2one',
+                'value_reference': 'res.partner.title,%d' % madam.id,
+                'res_id': 'res.partner,%d' % partner.id,
+            })
+        rows = props.with_context(xmlid_value_reference=True).read(
+            ['value_reference', 'res_id'])
+        self.assertEqual(
+            [(x['value_reference'], x['res_id']) for x in rows], [
+                ('base.res_partner_title_madam', 'base.main_partner'),
+                ('base.res_partner_title_madam', 'base.partner_root'),
+            ])
+        data = [
+            [str(props[0].id), 'base.res_partner_title_mister',
+             'base.partner_root'],
+            [str(props[1].id), 'base.res_partner_title_mister',
+             'base.main_partner'],
+        ]
+        with patch(IR_PROPERTY_PATH + '.prefetch_xmlids',
+                   wraps=prefetch_xmlids) as prefetch:
+            res = prop_model.with_context(
+                xmlid_value_reference=True
+            ).load(['.id', 'value_reference', 'res_id'], data)
+        # all the rows are resolved at once
+        self.assertEqual(prefetch.call_count, 1)
+        self.assertFalse(res['messages'])
+        props.invalidate_cache()
+        self.assertEqual(props.mapped('value_reference'), [
+            'res.partner.title,%d' % mister.id,
+        ] * 2)
+        self.assertEqual(props.mapped('res_id'), [
+            'res.partner,%d' % partners[1].id,
+            'res.partner,%d' % partners[0].id,
+        ])
@@ -1,18 +1,36 @@
 # Copyright 2017 Camptocamp SA
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+from odoo import exceptions, tools
+
 from . common import BaseCase
+from .fake_models import TestSettings, TestTitleRelated, TestCopyPlain
 from ..config import SPECIAL_FIELDS
+from ..copy_loader import copy_records, copy_unsafe_reasons
+from ..exporter import export_rows
+from ..sql_export import export_rows as sql_export_rows
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 
 
 class SongCase(BaseCase):
 
+    TEST_MODELS_KLASSES = [TestSettings, TestTitleRelated, TestCopyPlain]
+
     @classmethod
     def setUpClass(cls):
         super(SongCase, cls).setUpClass()
+        cls._setup_test_models()
         fixture = 'fixture_song1'
         cls._load_xml('base_dj', 'tests/fixtures/%s.xml' % fixture)
 
+    @classmethod
+    def tearDownClass(cls):
+        cls._teardown_models()
+        super(SongCase, cls).tearDownClass()
+
     def test_get_all_fields(self):
         """Get all the fields that are 'exportable'."""
         song = self.env.ref('base_dj.test_song1_partner_category')
@@ -68,3 +86,376 @@ class SongCase(BaseCase):
         # TODO: check results, we are just testing that it does not break ATM
         self.assertTrue(path)
         self.assertTrue(content)
+
+    def test_deferred_onchanges(self):
+        """Onchanges can be deferred and played in bulk per compilation."""
+        comp = self.env.ref('base_dj.test_song1_partner_category')\
+            .compilation_id
+        song = self.env['dj.song'].with_context(
+            dj_defer_onchanges=True
+        ).create({
+            'compilation_id': comp.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'song_type': 'load_csv_defer_parent',
+        })
+        self.assertTrue(song.onchanges_pending)
+        self.assertEqual(song.template_path, 'base_dj:discs/song.tmpl')
+        comp.play_songs_onchanges()
+        self.assertFalse(song.onchanges_pending)
+        self.assertEqual(
+            song.template_path, 'base_dj:discs/song_defer_parent.tmpl')
+
+    def test_deferred_onchanges_keep_values(self):
+        """Deferred onchanges are played once module's data is loaded.
+
+        Values set at creation are kept.
+        """
+        comp = self.env.ref('base_dj.test_song1_partner_category')\
+            .compilation_id
+        song = self.env['dj.song'].with_context(
+            dj_defer_onchanges=True
+        ).create({
+            'compilation_id': comp.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'song_type': 'load_csv_defer_parent',
+            'only_config': True,
+        })
+        self.assertTrue(song.onchanges_pending)
+        options = tools.config.options
+        # nothing to play if no module is installed/updated
+        with patch.dict(options, {'init': {}, 'update': {}}):
+            self.env['dj.song']._register_hook()
+        self.assertTrue(song.onchanges_pending)
+        with patch.dict(options, {'init': {}, 'update': {'base_dj': 1}}):
+            self.env['dj.song']._register_hook()
+        self.assertFalse(song.onchanges_pending)
+        self.assertFalse(song.onchanges_keep_fields)
+        self.assertEqual(
+            song.template_path, 'base_dj:discs/song_defer_parent.tmpl')
+        # song type's default is not applied
+        self.assertTrue(song.only_config)
+
+    def test_onchanges_keep_values(self):
+        """Values set at creation are kept when onchanges are played."""
+        comp = self.env.ref('base_dj.test_song1_partner_category')\
+            .compilation_id
+        song = self.env['dj.song'].create({
+            'compilation_id': comp.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'song_type': 'load_csv_defer_parent',
+            'only_config': True,
+        })
+        self.assertFalse(song.onchanges_pending)
+        self.assertEqual(
+            song.template_path, 'base_dj:discs/song_defer_parent.tmpl')
+        # song type's default is not applied
+        self.assertTrue(song.only_config)
+
+    def _create_dependant_songs(self):
+        comp = self.env.ref('base_dj.test_song1_partner_category')\
+            .compilation_id
+        category = self.env['res.partner.category'].create({
+            'name': 'DJ master',
+            'partner_ids': [(6, 0, self.env.ref('base.main_partner').ids)],
+        })
+        master = self.env['dj.song'].create({
+            'compilation_id': comp.id,
+            'model_id': self.env.ref('base.model_res_partner_category').id,
+            'domain': str([('id', '=', category.id)]),
+            'sequence': 100,
+        })
+        dependant = self.env['dj.song'].create({
+            'compilation_id': comp.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'sequence': 90,
+            'depends_on_ids': [(0, 0, {
+                'master_song_id': master.id,
+                'model_field': 'partner_ids',
+            })],
+        })
+        return master, dependant
+
+    def test_dependant_domain_subquery(self):
+        master, dependant = self._create_dependant_songs()
+        partner = self.env.ref('base.main_partner')
+        self.assertTrue(dependant.depends_domain_outdated)
+        records = dependant._get_exportable_records()
+        self.assertIn('inselect', str(dependant.eval_domain()))
+        self.assertEqual(records, partner)
+        # subqueries are never stored
+        dependant.compilation_id._get_songs_playlist()
+        self.assertFalse(dependant.depends_domain_outdated)
+        self.assertNotIn('inselect', dependant.domain)
+        # song's own domain filters master's records
+        dependant.domain = str([('id', '!=', partner.id)])
+        self.assertFalse(dependant._get_exportable_records())
+        dependant.domain = '[]'
+        # changing master's domain flags dependant songs
+        master.domain = "[('id', '=', 0)]"
+        self.assertTrue(dependant.depends_domain_outdated)
+        self.assertFalse(dependant._get_exportable_records())
+
+    def test_dependant_domain_listed_ids(self):
+        master, dependant = self._create_dependant_songs()
+        partner = self.env.ref('base.main_partner')
+        # master w/ python code: its records get listed on the fly
+        master.python_code = (
+            "records = env['res.partner.category'].search("
+            "[('name', '=', 'DJ master')])")
+        self.assertIn(('id', 'in', partner.ids), dependant.eval_domain())
+        self.assertEqual(dependant.records_count, 1)
+        self.assertEqual(dependant.domain, '[]')
+        # song's own domain filters master's records
+        dependant.domain = str([('id', '!=', partner.id)])
+        self.assertFalse(dependant._get_exportable_records())
+        # ids stored in the domain by former versions are reset on burn
+        dependant.write({
+            'domain': str([('id', 'in', [0])]),
+            'depends_domain_outdated': True,
+        })
+        self.assertFalse(dependant._get_exportable_records())
+        dependant.burn_track()
+        self.assertFalse(dependant.depends_domain_outdated)
+        self.assertEqual(dependant.domain, '[]')
+        self.assertEqual(dependant._get_exportable_records(), partner)
+        # changing master flags dependant songs
+        master.write({
+            'domain': "[('id', '=', 0)]",
+            'python_code': "records = env['res.partner.category'].browse()",
+        })
+        self.assertTrue(dependant.depends_domain_outdated)
+        self.assertFalse(dependant._get_exportable_records())
+
+    def test_dependencies_order_and_pruning(self):
+        master, dependant = self._create_dependant_songs()
+        songs = master | dependant
+        # master comes 1st even if its sequence is higher
+        self.assertEqual(
+            songs._sorted_by_dependencies().ids, [master.id, dependant.id])
+        # no record for master song: dependant is dropped
+        master.domain = "[('id', '=', 0)]"
+        self.assertEqual(songs._sorted_by_dependencies().ids, [master.id])
+
+    def test_heavy_import(self):
+        song = self.env.ref('base_dj.test_song1_partner_category')
+        count = len(song._get_exportable_records())
+        params = self.env['ir.config_parameter'].sudo()
+        params.set_param('base_dj.heavy_import_threshold', str(count - 1))
+        params.set_param('base_dj.heavy_import_chunk_size', '1')
+        # switch to heavy import when records exceed the threshold
+        song.onchange_records_count()
+        self.assertEqual(song.song_type, 'load_csv_heavy')
+        self.assertEqual(song.template_path, 'base_dj:discs/song_heavy.tmpl')
+        tracks = song.burn_track()
+        paths = song.real_csv_chunk_paths()
+        self.assertEqual(len(paths), count)
+        self.assertEqual(paths[0], song.real_csv_path()[:-4] + '_001.csv')
+        self.assertEqual(
+            [x[0] for x in tracks],
+            paths + [song.real_second_pass_csv_path()])
+        # fields are recomputed before committing each chunk
+        __, content = song.compilation_id.burn_disc()
+        loop = content[content.index('for i, path in enumerate(paths'):]
+        self.assertLess(
+            loop.index('model.recompute()'), loop.index('ctx.env.cr.commit()'))
+        # and back to standard import
+        params.set_param('base_dj.heavy_import_threshold', str(count))
+        song.onchange_records_count()
+        self.assertEqual(song.song_type, 'load_csv')
+        # threshold is checked again at burn
+        params.set_param('base_dj.heavy_import_threshold', str(count - 1))
+        song.compilation_id._get_songs_playlist()
+        self.assertEqual(song.song_type, 'load_csv_heavy')
+
+    def test_chunk_size(self):
+        song = self.env.ref('base_dj.test_song1_partner_category')
+        records = song._get_exportable_records()
+        # `parent_id` is loaded in a 2nd pass
+        second_pass_path = song.real_second_pass_csv_path()
+        self.assertEqual(
+            [x[0] for x in song.burn_track()],
+            [song.real_csv_path(), second_pass_path])
+        song.chunk_size = 2
+        tracks = song.burn_track()
+        self.assertEqual(tracks[-1][0], second_pass_path)
+        chunks = tracks[:-1]
+        self.assertEqual(len(chunks), -(-len(records) // 2))
+        self.assertEqual([x[0] for x in chunks], song.real_csv_chunk_paths())
+        self.assertTrue(chunks[-1][0].endswith(
+            '_{:03d}.csv'.format(len(chunks))))
+        # each chunk has its header and up to 2 records
+        for __, content in chunks:
+            self.assertLessEqual(len(content.splitlines()), 3)
+        # templates of other song types load one CSV file
+        song.song_type = 'load_csv_defer_parent'
+        self.assertEqual(
+            [x[0] for x in song.burn_track()],
+            [song.real_csv_path(), second_pass_path])
+        self.assertEqual(song.real_csv_chunk_paths(), [song.real_csv_path()])
+
+    def test_copy_song(self):
+        song = self.env.ref('base_dj.test_song1_partner_category')
+        # categories have a parent store: not a plain table
+        with self.assertRaises(exceptions.ValidationError):
+            song.song_type = 'load_csv_copy'
+        model = self.env['dj.test.copy.plain']
+        record = model.create({'name': 'Old', 'sequence': 1})
+        self.env['ir.model.data'].create({
+            'module': '__setup__',
+            'name': 'copy_plain_old',
+            'model': model._name,
+            'res_id': record.id,
+        })
+        partner = self.env.ref('base.main_partner')
+        header = ['id', 'name', 'amount', 'flag', 'partner_id/id']
+        rows = [
+            ['__setup__.copy_plain_old', 'Updated', '1.5', 'True',
+             'base.main_partner'],
+            ['__setup__.copy_plain_new', 'New', '', '', ''],
+        ]
+        self.assertEqual(copy_unsafe_reasons(model, header), [])
+        ids = copy_records(model, header, rows)
+        # existing record updated in place
+        self.assertEqual(ids[0], record.id)
+        self.assertEqual(record.name, 'Updated')
+        self.assertEqual(record.amount, 1.5)
+        self.assertTrue(record.flag)
+        self.assertEqual(record.partner_id, partner)
+        # columns not in the file are left untouched
+        self.assertEqual(record.sequence, 1)
+        # new record inserted w/ defaults for missing columns
+        new_record = model.browse(ids[1])
+        self.assertEqual(new_record.name, 'New')
+        # empty values stored like the orm does
+        self.env.cr.execute(
+            'SELECT amount, flag, partner_id FROM dj_test_copy_plain '
+            'WHERE id = %s', (new_record.id, ))
+        self.assertEqual(self.env.cr.fetchone(), (0.0, False, None))
+        self.assertFalse(new_record.partner_id)
+        self.assertEqual(new_record.sequence, 10)
+        self.assertTrue(new_record.create_date)
+        # xmlid registered only for the new record
+        self.env.cr.execute("""
+            SELECT module, name, res_id FROM ir_model_data
+            WHERE model = %s ORDER BY res_id
+        """, (model._name, ))
+        self.assertEqual(self.env.cr.fetchall(), [
+            ('__setup__', 'copy_plain_old', record.id),
+            ('__setup__', 'copy_plain_new', new_record.id),
+        ])
+        self.assertEqual(
+            self.env.ref('__setup__.copy_plain_new'), new_record)
+        # orm and sequence still agree on next ids
+        self.assertGreater(model.create({'name': 'Next'}).id, new_record.id)
+
+    def test_copy_refused(self):
+        # titles have translatable fields and stored dependants
+        with self.assertRaises(ValueError):
+            copy_records(
+                self.env['res.partner.title'], ['id', 'name', 'shortcut'],
+                [['base.res_partner_title_madam', 'Madam DJ', 'Mdj.']])
+
+    def test_copy_unsafe_translatable(self):
+        title_model = self.env['res.partner.title']
+        self.assertIn(
+            'translatable field: name',
+            copy_unsafe_reasons(title_model, ['id', 'name']))
+
+    def test_copy_unsafe_dependants(self):
+        # `dj.test.title.related` stores titles' shortcut
+        self.assertIn(
+            'stored fields of other models depend on it: '
+            'dj.test.title.related.title_shortcut',
+            copy_unsafe_reasons(self.env['res.partner.title'], ['id']))
+
+    def test_make_second_pass_csv(self):
+        song = self.env.ref('base_dj.test_song1_partner_category')
+        self.assertEqual(song.get_csv_field_names_exclude(), ['parent_id/id'])
+        records = song._get_exportable_records()
+        path, content = song.make_second_pass_csv()
+        self.assertEqual(path, song.real_second_pass_csv_path())
+        self.assertTrue(path.endswith('res.partner.category.second_pass.csv'))
+        lines = content.decode().splitlines()
+        self.assertEqual(lines[0], '"id","parent_id/id"')
+        # only records w/ a parent
+        self.assertEqual(
+            len(lines) - 1, len(records.filtered('parent_id')))
+
+    def test_sql_export(self):
+        for xmlid in ('base_dj.test_song1_partner_category',
+                      'base_dj.test_song1_users'):
+            song = self.env.ref(xmlid)
+            path, content = song.make_csv()
+            song.sql_export = True
+            # same file, just faster
+            self.assertEqual(song.make_csv(), (path, content))
+
+    def test_sql_export_archived_relations(self):
+        categories = self.env['res.partner.category'].browse()
+        for name, active in (('Active', True), ('Archived', False)):
+            categories |= self.env['res.partner.category'].create({
+                'name': name,
+                'active': active,
+            })
+        partner = self.env['res.partner'].create({
+            'name': 'Export Me',
+            'category_id': [(6, 0, categories.ids)],
+        })
+        records = partner.with_context(dj_export=True)
+        row = sql_export_rows(records, ['id', 'category_id/id'])[0]
+        # archived records are exported too
+        self.assertEqual(
+            sorted(row[1].split(',')),
+            sorted(categories._dj_export_xmlids().values()))
+
+    def test_export_rows(self):
+        category = self.env['res.partner.category'].create({'name': 'Cat'})
+        partner = self.env['res.partner'].create({
+            'name': 'Export Me',
+            'type': 'invoice',
+            'parent_id': self.env.ref('base.main_partner').id,
+            'category_id': [(6, 0, category.ids)],
+        })
+        field_names = ['id', 'name', 'type', 'parent_id/id', 'category_id/id']
+        # standard export shows selection labels
+        row = partner.export_data(field_names)['datas'][0]
+        self.assertNotEqual(row[2], 'invoice')
+        records = partner.with_context(dj_export=True)
+        row = export_rows(records, field_names)[0]
+        self.assertEqual(row[1:3], ['Export Me', 'invoice'])
+        self.assertEqual(row[0], partner._dj_export_xmlid())
+        self.assertEqual(row[3], 'base.main_partner')
+        self.assertEqual(row[4], category._dj_export_xmlid())
+        # dj export works w/ flat columns only
+        with self.assertRaises(ValueError):
+            export_rows(records, ['parent_id/name'])
+
+    def test_settings_multicompany(self):
+        main = self.env.ref('base.main_company')
+        main.aka = 'djc'
+        company = self.env['res.company'].with_context(
+            defer_parent_store_computation=True
+        ).create({
+            'name': 'DJ Settings Inc.',
+            'aka': 'djs',
+        })
+        self.add_xmlid(company, 'base_dj.test_company_djs')
+        self.env.user.company_ids |= company
+        song = self.env['dj.song'].create({
+            'compilation_id': self.env.ref(
+                'base_dj.test_song1_partner_category').compilation_id.id,
+            'model_id': self.env['ir.model']._get('dj.test.settings').id,
+            'song_type': 'settings',
+        })
+        res = song.with_context(
+            dj_settings_company_xmlids=(
+                'base.main_company,base_dj.test_company_djs'),
+            dj_settings_fields_whitelist='company_name',
+        ).dj_get_settings_vals()
+        values = {aka: vals['company_name']['val'] for __, aka, vals in res}
+        # each company gets its own values
+        self.assertEqual(sorted(values), ['djc', 'djs'])
+        self.assertIn(main.name, values['djc'])
+        self.assertIn('DJ Settings Inc.', values['djs'])
+        # user's company is never switched
+        self.assertEqual(self.env.user.company_id, main)
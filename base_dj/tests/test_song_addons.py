@@ -3,6 +3,8 @@
 
 from . common import BaseCase
 from ..config import ADDONS_BLACKLIST
+from ..utils import get_addons_index, invalidate_addons_index
+from odoo.modules import get_module_path
 
 
 class AddonsSongCase(BaseCase):
@@ -19,6 +21,17 @@ class AddonsSongCase(BaseCase):
         for name in ADDONS_BLACKLIST:
             self.assertNotIn(name, addons)
 
+    def test_addons_index(self):
+        invalidate_addons_index()
+        index = get_addons_index()
+        self.assertIs(index, get_addons_index())
+        for mod in self.env['ir.module.module'].search([]):
+            self.assertEqual(
+                index.get(mod.name),
+                get_module_path(mod.name, display_warning=False) or None)
+        self.env['ir.module.module'].update_list()
+        self.assertIsNot(index, get_addons_index())
+
     def test_installed_addons(self):
         song = self.env.ref('base_dj.test_song_installed_addons')
         self.assertTrue(song.scratchable())
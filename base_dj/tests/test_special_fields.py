@@ -4,7 +4,14 @@
 from . common import BaseCompilationCase, load_filecontent
 from .fake_models import TestFileFields
 import codecs
+import os
+import tempfile
 from lxml import etree
+from ..models.base import read_dj_file
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 
 HTML = """
 <div id="yo">
@@ -95,6 +102,42 @@ class SpecialFieldsCase(BaseCompilationCase):
         cls._teardown_models()
         super().tearDownClass()
 
+    def test_file_fields_info(self):
+        info = self.model._dj_file_fields_info()
+        self.assertEqual(
+            sorted(info.keys()),
+            ['arch_db', 'some_file', 'some_html', 'some_image', 'some_text'])
+        self.assertEqual(info['some_image']['type'], 'binary')
+        # computed once per model
+        self.assertIs(info, self.model._dj_file_fields_info())
+        special = self.model._dj_special_fields(['name', 'some_text'])
+        self.assertEqual([x[0] for x in special], ['some_text'])
+
+    def test_read_paths_batch(self):
+        records = self.model.browse()
+        for name, html in (('foo', HTML), ('bar', False), ('baz', HTML)):
+            records |= self.model.create({'name': name, 'some_html': html})
+        calls = []
+
+        def _dj_export_xmlids(self):
+            calls.append(self.ids)
+            return _dj_export_xmlids.origin(self)
+
+        self.model._patch_method('_dj_export_xmlids', _dj_export_xmlids)
+        self.addCleanup(self.model._revert_method, '_dj_export_xmlids')
+        res = records.with_context(dj_export=True).read(['some_html'])
+        # paths and xmlids computed once for all the records w/ a value
+        self.assertEqual(calls, [(records[0] | records[2]).ids])
+        self.assertFalse(res[1]['some_html'])
+        for rec, name in ((res[0], 'foo'), (res[2], 'baz')):
+            self.assertIn(self.model._dj_path_prefix, rec['some_html'])
+            self.assertIn(
+                '__setup__.dj_test_filefields_%s__some_html' % name,
+                rec['some_html'])
+        # cache has been wiped: we get real values again
+        self.assertXMLEqual(
+            etree.fromstring(records[0].some_html), etree.fromstring(HTML))
+
     def test_burn_paths(self):
         self.model.create({
             'name': 'foo',
@@ -183,3 +226,41 @@ class SpecialFieldsCase(BaseCompilationCase):
         self.assertEqual(contents['some_text.txt'], TXT_RAW)
         self.assertEqual(contents['some_image.png'], IMAGE_RAW)
         self.assertEqual(contents['some_file.txt'], FILE_RAW)
+
+    def test_path_to_file(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, tmpdir)
+        abs_path = os.path.join(tmpdir, 'logo.png')
+        self.addCleanup(os.remove, abs_path)
+        with open(abs_path, 'wb') as ff:
+            ff.write(IMAGE_RAW)
+        path = self.model._dj_path_prefix + abs_path
+        info = {'type': 'binary'}
+        self.assertEqual(
+            self.model._dj_path_to_file('some_image', info, path), IMAGE)
+        # read again once changed on disk
+        with open(abs_path, 'wb') as ff:
+            ff.write(FILE_RAW)
+        os.utime(abs_path, (1, 1))
+        self.assertEqual(
+            self.model._dj_path_to_file('some_image', info, path), FILE)
+        # plain values are left untouched
+        self.assertEqual(
+            self.model._dj_path_to_file('some_image', info, IMAGE), IMAGE)
+
+    def test_big_files_not_cached(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, tmpdir)
+        abs_path = os.path.join(tmpdir, 'big.txt')
+        self.addCleanup(os.remove, abs_path)
+        with open(abs_path, 'w') as ff:
+            ff.write('x' * 10)
+        base_module = 'odoo.addons.base_dj.models.base'
+        with patch(base_module + '.DJ_FILE_MMAP_THRESHOLD', 10), \
+                patch(base_module + '._read_dj_file_cached') as cached:
+            # text or binary, whatever the type
+            self.assertEqual(read_dj_file(abs_path), 'x' * 10)
+            self.assertEqual(
+                read_dj_file(abs_path, binary=True),
+                codecs.encode(b'x' * 10, 'base64'))
+        self.assertFalse(cached.called)
@@ -2,6 +2,15 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 from . common import BaseCase
+from ..utils import (
+    follow_record_fields,
+    _follow_path_orm,
+    _follow_path_sql,
+)
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 
 
 class XMLIDCase(BaseCase):
@@ -89,6 +98,35 @@ class XMLIDCase(BaseCase):
             '__setup__.res_partner_bank_30000_yourcompany'
         )
 
+    def test_follow_record_fields(self):
+        foo = self.env.ref('base_dj.test_company_foo')
+        baz = self.env.ref('base_dj.test_company_baz')
+        res = follow_record_fields(
+            foo | baz, ['partner_id.name', 'partner_id.company_id'])
+        self.assertEqual(res, {
+            foo.id: {
+                'partner_id.name': foo.partner_id.name,
+                'partner_id.company_id': foo.partner_id.company_id.id,
+            },
+            baz.id: {
+                'partner_id.name': baz.partner_id.name,
+                'partner_id.company_id': baz.partner_id.company_id.id,
+            },
+        })
+        with self.assertRaises(KeyError):
+            follow_record_fields(foo, ['partner_id.not_a_field'])
+
+    def test_follow_record_fields_sql(self):
+        partners = self.env['res.partner'].search([])
+        for path in ('company_id.name', 'parent_id.is_company',
+                     'company_id.partner_id', 'parent_id.parent_id.color'):
+            values = _follow_path_sql(partners, path)
+            self.assertIsNotNone(values)
+            self.assertEqual(values, _follow_path_orm(partners, path))
+        # computed fields are not read via SQL
+        self.assertIsNone(
+            _follow_path_sql(partners, 'company_id.display_name'))
+
     def test_xmlid_with_specific_xmlid_fields_from_equalizer(self):
         # new record
         rec = self.env['res.partner.bank'].create({'acc_number': '20000', })
@@ -102,6 +140,39 @@ class XMLIDCase(BaseCase):
             '__setup__.bank_account_20000'
         )
 
+    def test_equalizer_conf_cache(self):
+        equalizer = self.env['dj.equalizer']
+        self.assertEqual(
+            equalizer.get_model_conf('res.partner.bank', 'xmlid_fields'), [])
+        # create, write and unlink invalidate the cache
+        config = equalizer.create({
+            'model': 'res.partner.bank',
+            'xmlid_fields': 'acc_number',
+        })
+        self.assertEqual(
+            equalizer.get_model_conf('res.partner.bank', 'xmlid_fields'),
+            ['acc_number'])
+        config.xmlid_fields = 'acc_number,bank_id'
+        self.assertEqual(
+            equalizer.get_model_conf('res.partner.bank', 'xmlid_fields'),
+            ['acc_number', 'bank_id'])
+        config.unlink()
+        self.assertEqual(
+            equalizer.get_model_conf('res.partner.bank', 'xmlid_fields'), [])
+
+    def test_equalizer_default_conf(self):
+        equalizer = self.env['dj.equalizer']
+        conf = equalizer.get_model_conf('res.partner.bank')
+        # we get a copy
+        conf['field_blacklist'].append('acc_number')
+        conf['model_context']['foo'] = 1
+        with patch.object(type(equalizer), '_compute_conf') as mocked:
+            # models w/ no equalizer share the same conf
+            conf = equalizer.get_model_conf('res.partner.bank')
+            self.assertFalse(mocked.called)
+        self.assertEqual(conf['field_blacklist'], [])
+        self.assertEqual(conf['model_context'], {})
+
     def test_xmlid_multicompany(self):
         # new record for the same company
         rec = self.env['res.partner.bank'].create({'acc_number': '56789', })
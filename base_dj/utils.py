@@ -6,9 +6,11 @@ from .slugifier import slugify
 
 import odoo
 import io
-import zipfile
-import time
+import os
+import re
 import datetime
+import heapq
+from collections import defaultdict
 from lxml import etree
 from contextlib import contextmanager
 
@@ -30,27 +32,9 @@ except NameError:
     basestring = str
 
 
-def create_zipfile(files):
-    in_mem_zip = io.BytesIO()
-    with zipfile.ZipFile(in_mem_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-        for filepath, data in files:
-            # File "/usr/lib/python2.7/zipfile.py", line 1247, in writestr
-            # TypeError: 'unicode' does not have the buffer interface
-            if isinstance(data, str):
-                data = data.encode('utf-8')
-            # use info to keep date and set permissions
-            info = zipfile.ZipInfo(
-                filepath, date_time=time.localtime(time.time()))
-            # set proper permissions
-            info.external_attr = 0o644 << 16
-            zf.writestr(info, data)
-    in_mem_zip.seek(0)
-    return in_mem_zip
-
-
-def make_title(name):
+def make_title(name, ext='zip'):
     dt = datetime.datetime.now().strftime('%Y%m%d_%H%M')
-    return '{}-{}.zip'.format(slugify(name).replace('-', '_'), dt)
+    return '{}-{}.{}'.format(slugify(name).replace('-', '_'), dt, ext)
 
 
 def csv_from_data(fields, rows):
@@ -85,14 +69,101 @@ def force_company(env, company_id):
 
 def property_to_xmlid(env, val):
     """Convert property field value to xmlid."""
-    model, res_id = val.split(',')
-    return env[model].browse(int(res_id))._dj_export_xmlid()
+    return properties_to_xmlids(env, [val])[val]
+
+
+def properties_to_xmlids(env, values):
+    """Convert many property field values to xmlids.
+
+    Values (`model,ID`) are grouped by model and xmlids
+    are retrieved (or created) w/ one query per model.
+
+    :return: dictionary `{value: xmlid}`
+    """
+    parsed = {}
+    ids_by_model = defaultdict(set)
+    for val in values:
+        model, res_id = val.split(',')
+        parsed[val] = (model, int(res_id))
+        ids_by_model[model].add(int(res_id))
+    xids = {}
+    for model, ids in ids_by_model.items():
+        records = env[model].browse(list(ids))
+        for res_id, xid in records._dj_export_xmlids().items():
+            xids[(model, res_id)] = xid
+    return {val: xids[key] for val, key in parsed.items()}
 
 
 def xmlid_to_property(env, val):
     """Inverse `property_to_xmlid` to get property value from xmlid."""
-    record = env.ref(val)
-    return '%s,%i' % (record._name, record.id)
+    return xmlids_to_properties(env, [val])[val]
+
+
+def xmlids_to_properties(env, xmlids):
+    """Inverse `properties_to_xmlids` w/ one query for all the xmlids.
+
+    :return: dictionary `{xmlid: value}`
+    """
+    return {
+        xmlid: '%s,%i' % (model, res_id)
+        for xmlid, (model, res_id) in xmlids_to_ids(env, xmlids).items()
+    }
+
+
+def xmlids_to_ids(env, xmlids, raise_if_not_found=True):
+    """Resolve many xmlids w/ one query on `ir_model_data` per chunk.
+
+    xmlids already resolved by `prefetch_xmlids` are not queried again.
+
+    :param raise_if_not_found: when false unknown xmlids are skipped.
+    :return: dictionary `{xmlid: (model, res_id)}`
+    """
+    known = env.context.get('dj_xmlids_map') or {}
+    res = {x: known[x] for x in xmlids if x in known}
+    pairs = set()
+    for xmlid in xmlids:
+        if xmlid in res:
+            continue
+        if '.' not in xmlid:
+            if not raise_if_not_found:
+                continue
+            raise ValueError('External ID not found in the system: %s' % xmlid)
+        pairs.add(tuple(xmlid.split('.', 1)))
+    for sub_pairs in env.cr.split_for_in_conditions(sorted(pairs)):
+        env.cr.execute("""
+            SELECT module, name, model, res_id
+            FROM ir_model_data
+            WHERE (module, name) IN %s
+        """, (sub_pairs, ))
+        res.update(
+            ('%s.%s' % (module, name), (model, res_id))
+            for module, name, model, res_id in env.cr.fetchall()
+        )
+    missing = [x for x in xmlids if x not in res]
+    if missing and raise_if_not_found:
+        raise ValueError(
+            'External ID not found in the system: %s' % ', '.join(missing))
+    return res
+
+
+XMLID_RE = re.compile(r'^[\w-]+\.[\w.-]+$')
+
+
+def prefetch_xmlids(env, values):
+    """Resolve the xmlids listed in many values w/ one query.
+
+    Meant for `load`: rows are imported one by one
+    but their xmlids can be resolved all at once beforehand.
+    Values that are not xmlids are ignored.
+
+    :return: dictionary to pass to `xmlids_to_ids` via `dj_xmlids_map` ctx key
+    """
+    xmlids = set()
+    for value in values:
+        if value and is_string(value):
+            xmlids.update(
+                x for x in string_to_list(value) if XMLID_RE.match(x))
+    return xmlids_to_ids(env, xmlids, raise_if_not_found=False)
 
 
 def is_xml(content):
@@ -150,15 +221,275 @@ def string_to_list(astring, separator=',',
 
 def follow_record_field(record, field):
     """Allow nested fields declaration `foo_id.user_id`."""
-    attrs = field.split('.')
-    for attr in attrs:
-        try:
-            record = record[attr]
-        except KeyError:
+    return follow_record_fields(record, [field])[record.id][field]
+
+
+def follow_record_fields(records, paths):
+    """Resolve dotted field paths for all the records at once.
+
+    Paths made only of plain stored columns are read w/ one SQL query
+    joining all the tables. Others go through the ORM
+    and each step of a path is prefetched for the whole recordset.
+    In both cases the number of queries does not depend
+    on the number of records.
+
+    :param records: a recordset
+    :param paths: list of (dotted) field names like `company_id.name`
+    :return: dictionary `{record id: {path: value}}`.
+        Relations are returned as ids.
+    """
+    res = {rec.id: {} for rec in records}
+    for path in paths:
+        values = _follow_path_sql(records, path)
+        if values is None:
+            values = _follow_path_orm(records, path)
+        for rec_id, value in values.items():
+            if isinstance(value, odoo.models.Model):
+                value = value.id
+            res[rec_id][path] = value
+    return res
+
+
+def _follow_path_orm(records, path):
+    values = {rec.id: rec for rec in records}
+    for attr in path.split('.'):
+        if not values:
+            break
+        ids = set()
+        for value in values.values():
+            ids.update(value.ids)
+        current = next(iter(values.values())).browse(list(ids))
+        if attr not in current._fields:
             # improve error msg
             raise KeyError(
-                'Model `%s` has no field named `%s`' % (record._name, attr)
+                'Model `%s` has no field named `%s`' % (
+                    current._name, attr)
             )
-    if isinstance(record, odoo.models.Model):
-        record = record.id
-    return record
+        # prefetch this step for all the records
+        current.mapped(attr)
+        values = {
+            rec_id: value[attr] for rec_id, value in values.items()
+        }
+    return values
+
+
+def _sql_path_fields(model, path):
+    """Return fields to walk through `path` via SQL.
+
+    Return None if the path cannot be read w/ plain SQL
+    w/out changing its value.
+    """
+    res = []
+    attrs = path.split('.')
+    for i, attr in enumerate(attrs):
+        field = model._fields.get(attr)
+        if (field is None or not field.store or not field.column_type or
+                field.compute or field.inherited or
+                field.company_dependent):
+            return None
+        if (field.translate and
+                model.env.context.get('lang') not in (None, 'en_US')):
+            # translated values come from ir.translation
+            return None
+        res.append(field)
+        if i < len(attrs) - 1:
+            if field.type != 'many2one':
+                return None
+            model = model.env[field.comodel_name]
+    return res
+
+
+def _follow_path_sql(records, path):
+    if not records or not all(isinstance(x, int) for x in records.ids):
+        return None
+    path_fields = _sql_path_fields(records.browse(), path)
+    if path_fields is None:
+        return None
+    tables = [records._table]
+    joins = []
+    for i, field in enumerate(path_fields[:-1]):
+        tables.append(records.env[field.comodel_name]._table)
+        joins.append('LEFT JOIN "{}" t{} ON t{}.id = t{}."{}"'.format(
+            tables[-1], i + 1, i + 1, i, field.name))
+    last = path_fields[-1]
+    query = 'SELECT t0.id, t{}."{}" FROM "{}" t0 {} WHERE t0.id IN %s'.format(
+        len(tables) - 1, last.name, tables[0], ' '.join(joins))
+    model = records.env[last.model_name]
+    res = {}
+    cr = records.env.cr
+    for sub_ids in cr.split_for_in_conditions(set(records.ids)):
+        cr.execute(query, (sub_ids, ))
+        for rec_id, raw in cr.fetchall():
+            # convert as the ORM does when reading from database
+            value = last.convert_to_cache(raw, model, validate=False)
+            res[rec_id] = last.convert_to_record(value, model)
+    return res
+
+
+class DependencyCycleError(ValueError):
+    """Raised when a dependency graph contains cycles."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        super(DependencyCycleError, self).__init__(
+            'Circular dependency between: %s'
+            % ', '.join([str(x) for x in nodes]))
+
+
+def _pending_dependencies(nodes, dependencies):
+    known = set(nodes)
+    return {
+        node: (set(dependencies.get(node, ())) & known) - {node}
+        for node in nodes
+    }
+
+
+def toposort(nodes, dependencies):
+    """Sort nodes so that each node comes after the nodes it depends on.
+
+    The original order is preserved as much as possible.
+
+    :param nodes: ordered iterable of hashable nodes
+    :param dependencies: dictionary `node -> nodes it depends on`.
+        Dependencies on nodes not listed in `nodes` are ignored.
+    """
+    nodes = list(nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    pending = _pending_dependencies(nodes, dependencies)
+    dependants = {node: [] for node in nodes}
+    for node, deps in pending.items():
+        for dep in deps:
+            dependants[dep].append(node)
+    ready = [position[node] for node in nodes if not pending[node]]
+    heapq.heapify(ready)
+    res = []
+    while ready:
+        node = nodes[heapq.heappop(ready)]
+        res.append(node)
+        for dependant in dependants[node]:
+            pending[dependant].discard(node)
+            if not pending[dependant]:
+                heapq.heappush(ready, position[dependant])
+    if len(res) < len(nodes):
+        raise DependencyCycleError([x for x in nodes if pending[x]])
+    return res
+
+
+def toposort_stages(nodes, dependencies):
+    """Group nodes in stages depending only on previous stages.
+
+    Nodes in the same stage do not depend on each other.
+    Same params as `toposort`.
+
+    :return: list of stages (lists of nodes).
+    """
+    nodes = list(nodes)
+    pending = _pending_dependencies(nodes, dependencies)
+    stages = []
+    while pending:
+        stage = [x for x in nodes if x in pending and not pending[x]]
+        if not stage:
+            raise DependencyCycleError([x for x in nodes if x in pending])
+        stages.append(stage)
+        for node in stage:
+            del pending[node]
+        for deps in pending.values():
+            deps.difference_update(stage)
+    return stages
+
+
+def strongly_connected_components(nodes, dependencies):
+    """Group nodes that depend on each other, directly or not.
+
+    Same params as `toposort`.
+
+    :return: list of components (lists of nodes in original order).
+    """
+    nodes = list(nodes)
+    pending = _pending_dependencies(nodes, dependencies)
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    res = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        # iterative Tarjan: frames are `(node, dependencies iterator)`
+        work = [(root, iter(pending[root]))]
+        while work:
+            node, deps = work[-1]
+            dep = next(deps, None)
+            if dep is not None:
+                if dep not in index:
+                    index[dep] = lowlink[dep] = len(index)
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(pending[dep])))
+                elif dep in on_stack:
+                    lowlink[node] = min(lowlink[node], index[dep])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = set()
+                while node not in component:
+                    item = stack.pop()
+                    on_stack.discard(item)
+                    component.add(item)
+                res.append([x for x in nodes if x in component])
+    return res
+
+
+# process-wide `module name -> module path` index
+_addons_index = {}
+
+
+def _build_addons_index(addons_paths):
+    index = {}
+    manifests = odoo.modules.module.MANIFEST_NAMES
+    for adp in addons_paths:
+        if not os.path.isdir(adp):
+            continue
+        for name in os.listdir(adp):
+            if name.endswith('.zip'):
+                name = name[:-len('.zip')]
+            if name in index:
+                # same as `get_module_path`: first path wins
+                continue
+            mod_path = os.path.join(adp, name)
+            if (os.path.isfile(mod_path + '.zip') or any(
+                    os.path.isfile(os.path.join(mod_path, manifest))
+                    for manifest in manifests)):
+                index[name] = mod_path
+    return index
+
+
+def get_addons_index():
+    """Map module names to their path, scanning addons paths only once.
+
+    The index is built per process and rebuilt if addons paths change.
+    Use `invalidate_addons_index` to drop it (eg: on modules list update).
+    """
+    addons_paths = tuple(odoo.modules.module.ad_paths)
+    if addons_paths not in _addons_index:
+        _addons_index.clear()
+        _addons_index[addons_paths] = _build_addons_index(addons_paths)
+    return _addons_index[addons_paths]
+
+
+def invalidate_addons_index():
+    _addons_index.clear()
+
+
+def get_module_repo(module_name):
+    """Return repository (addons path folder) name of given module."""
+    mod_path = get_addons_index().get(module_name)
+    if not mod_path:
+        return None
+    return os.path.split(os.path.dirname(mod_path))[-1]
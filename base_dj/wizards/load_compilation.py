@@ -2,25 +2,65 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
 from odoo import models, fields, api, exceptions, _
-import zipfile
-import os
+from contextlib import contextmanager
+import base64
 import csv
-import codecs
-from io import StringIO
+import io
+import itertools
+import logging
+import os
+import tempfile
+import zipfile
+
+_logger = logging.getLogger(__name__)
+
+# rows passed to each `load` call
+LOAD_BATCH_SIZE = 500
+# zip files bigger than this are spooled to disk while importing
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+# base64 data decoded at once (multiple of 4)
+DECODE_CHUNK_SIZE = 256 * 1024
+
+
+def b64decode_to(data, fileobj, chunk_size=None):
+    """Decode base64 `data` into `fileobj` chunk by chunk."""
+    chunk_size = chunk_size or DECODE_CHUNK_SIZE
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    pending = b''
+    for start in range(0, len(data), chunk_size):
+        # drop new lines and keep groups of 4 chars
+        chunk = pending + b''.join(data[start:start + chunk_size].split())
+        cut = len(chunk) - len(chunk) % 4
+        fileobj.write(base64.b64decode(chunk[:cut]))
+        pending = chunk[cut:]
+    if pending:
+        # let b64decode complain about broken padding
+        fileobj.write(base64.b64decode(pending))
 
 
 def csv_unireader(f, encoding="utf-8", **fmtparams):
+    """Lazily iterate rows from a binary file object."""
     data = csv.reader(
-        codecs.iterencode(codecs.iterdecode(f, encoding), "utf-8"), **fmtparams
-    )
+        io.TextIOWrapper(f, encoding=encoding, newline=''), **fmtparams)
     for row in data:
-        yield [e.decode("utf-8") for e in row]
+        yield row
 
 
 def read_csv(data, dialect='excel', encoding='utf-8', **fmtparams):
-    rows = csv_unireader(data, encoding=encoding, **fmtparams)
+    """Return CSV header and an iterator over the rows."""
+    rows = csv_unireader(data, encoding=encoding, dialect=dialect, **fmtparams)
     header = next(rows)
-    return header, list(rows)
+    return header, rows
+
+
+def split_every(size, iterable):
+    """Yield lists of `size` items from `iterable`."""
+    iterator = iter(iterable)
+    batch = list(itertools.islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(iterator, size))
 
 
 class LoadCompilation(models.TransientModel):
@@ -33,39 +73,63 @@ class LoadCompilation(models.TransientModel):
         required=True,
     )
 
+    _dj_load_batch_size = LOAD_BATCH_SIZE
+
     def _get_model_from_filename(self, orig):
         fname, ext = os.path.splitext(os.path.basename(orig))
         return fname.split('-')[-1]
 
-    def read_csvs(self):
+    @contextmanager
+    def _open_zipfile(self):
+        """Decode uploaded file into a temp file and open it as zip."""
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as tmp:
+            b64decode_to(self.zip_file, tmp)
+            tmp.seek(0)
+            with zipfile.ZipFile(tmp) as zf:
+                yield zf
+
+    def _get_csv_members(self, zf):
+        """Map model names to CSV files in the zip."""
         res = {}
-        zipdata = StringIO()
-        zipdata.write(self.zip_file.decode('base64'))
-        with zipfile.ZipFile(zipdata) as zf:
-            for filename in zf.namelist():
-                if filename.endswith('.csv'):
-                    model_name = self._get_model_from_filename(filename)
-                    # read the file
-                    with zf.open(filename) as of:
-                        res[model_name] = of.readlines()
+        for filename in zf.namelist():
+            if filename.endswith('.csv'):
+                res[self._get_model_from_filename(filename)] = filename
         return res
 
     _dj_model_load_order = (
         'dj.genre', 'dj.compilation', 'dj.song', 'dj.song.dependency'
     )
 
+    def _load_csv(self, model_name, fileobj):
+        """Load CSV rows in batches to keep memory usage low."""
+        model = self.env[model_name]
+        header, rows = read_csv(fileobj)
+        ids = []
+        for batch in split_every(self._dj_load_batch_size, rows):
+            res = model.load(header, batch)
+            if not res['ids']:
+                raise exceptions.UserError(
+                    _('Cannot load %s:\n%s') % (
+                        model_name,
+                        '\n'.join(x['message'] for x in res['messages'])
+                    ))
+            ids.extend(res['ids'])
+            _logger.info('Loading %s: %d rows done', model_name, len(ids))
+        return ids
+
     @api.multi
     def action_load(self):
         self.ensure_one()
         res = {}
-        files = self.read_csvs()
-        for model_name in self._dj_model_load_order:
-            if model_name not in files:
-                raise exceptions.UserError(
-                    _('%s csv file missing!') % model_name)
-            header, rows = read_csv(files[model_name])
-            res[model_name] = self.env[model_name].load(header, rows)
-        comp_id = res['dj.compilation']['ids'][0]
+        with self._open_zipfile() as zf:
+            members = self._get_csv_members(zf)
+            for model_name in self._dj_model_load_order:
+                if model_name not in members:
+                    raise exceptions.UserError(
+                        _('%s csv file missing!') % model_name)
+                with zf.open(members[model_name]) as fileobj:
+                    res[model_name] = self._load_csv(model_name, fileobj)
+        comp_id = res['dj.compilation'][0]
         if self.name:
             self.env['dj.compilation'].browse(comp_id).name = self.name
         action = self.env.ref('base_dj.action_dj_compilation').copy_data()[0]